@@ -1,110 +1,161 @@
+import os
+
+import numpy as np
 import pandas as pd
 import warnings
-from math import radians, sin, cos, sqrt, atan2
 
-warnings.filterwarnings('ignore')
+from dataset_io import SHEETS, load_dataset, save_dataset
+from spatial_index import GridIndex
+from time_windows import FLEXIBILITY_COLUMN, TIME_WINDOW, departure_window_masks
 
+warnings.filterwarnings('ignore')
 
-drivers_df = pd.read_excel('Dataset.xlsx', sheet_name='Driver')
-riders_df = pd.read_excel('Dataset.xlsx', sheet_name='Rider')
-shifters_df = pd.read_excel('Dataset.xlsx', sheet_name='Shifter')
-drivers_df['departure_time'] = pd.to_datetime(drivers_df['departure_time'])
-riders_df['departure_time'] = pd.to_datetime(riders_df['departure_time'])
-shifters_df['departure_time'] = pd.to_datetime(shifters_df['departure_time'])
-
-
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371.0
-
-    lat1_rad = radians(lat1)
-    lon1_rad = radians(lon1)
-    lat2_rad = radians(lat2)
-    lon2_rad = radians(lon2)
-
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
-
-    a = sin(dlat/2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
-
-    distance = R * c
-    return distance
-
-
-def has_matching_departure_time(riders_df):
-    matching_indices = []
-    for rider_idx, rider_row in riders_df.iterrows():
-        rider_time = rider_row['departure_time']
-        if ((abs(drivers_df['departure_time'] - rider_time) <= pd.Timedelta(minutes=30)).any() or
-            (abs(shifters_df['departure_time'] - rider_time) <= pd.Timedelta(minutes=30)).any()):
-            matching_indices.append(rider_idx)
-    return riders_df.loc[matching_indices]
-
-def has_matching_departure_time_shifter(shifters_df):
-    shifter_indices = []
-    for shifter_idx, shifter_row in shifters_df.iterrows():
-         shifter_time = shifter_row['departure_time']
-         if ((abs(drivers_df['departure_time'] - shifter_time) <= pd.Timedelta(minutes=30)).any() or
-            (abs(riders_df['departure_time'] - shifter_time) <= pd.Timedelta(minutes=30)).any() or
-            (abs(shifters_df['departure_time'] - shifter_time) <= pd.Timedelta(minutes=30)).any()):
-             shifter_indices.append(shifter_idx)
-    return shifters_df.loc[shifter_indices]
-
-def has_matching_departure_time_driver(drivers_df):
-    driver_indices = []  
-    for driver_idx, driver_row in drivers_df.iterrows():  
-         driver_time = driver_row['departure_time']
-         if ((abs(riders_df['departure_time'] - driver_time) <= pd.Timedelta(minutes=30)).any() or
-            (abs(shifters_df['departure_time'] - driver_time) <= pd.Timedelta(minutes=30)).any()):
-             driver_indices.append(driver_idx)
-    return drivers_df.loc[driver_indices]
-
-def filter_data_and_save():
-
-# Filter riders based on matching departure times
-    valid_riders_df = has_matching_departure_time(riders_df)
-# Filter shifter based on matching departure times
-    valid_shifters_df = has_matching_departure_time_shifter(shifters_df)
-# Filter driver based on matching departure times
-    valid_drivers_df = has_matching_departure_time_driver(drivers_df)
-
-    def is_within_1km(lat1, lon1, dataframe):
-      for idx, row in dataframe.iterrows():
-        lat2 = row['Start_lat'] 
-        lon2 = row['Start_lon']
-        
-        if haversine(lat1, lon1, lat2, lon2) <= 1.0:
-          return True
-    
-      return False
-
-    # Filter the driver entries
-    valid_driver_indices = []
-    for driver_idx, driver_row in valid_drivers_df.iterrows():
-        if is_within_1km(driver_row['Start_lat'], driver_row['Start_lon'], valid_riders_df) or is_within_1km(driver_row['Start_lat'], driver_row['Start_lon'], valid_shifters_df):
-            valid_driver_indices.append(driver_idx)
-
-    # Filter the rider entries
-    valid_rider_indices = []
-    for rider_idx, rider_row in valid_riders_df.iterrows():
-        if is_within_1km(rider_row['Start_lat'], rider_row['Start_lon'], valid_shifters_df) or is_within_1km(rider_row['Start_lat'], rider_row['Start_lon'], valid_drivers_df):
-            valid_rider_indices.append(rider_idx)
-
-    # Filter the shifter entries
-    valid_shifter_indices = []
-    for shifter_idx, shifter_row in valid_shifters_df.iterrows():
-        if is_within_1km(shifter_row['Start_lat'], shifter_row['Start_lon'], valid_drivers_df) or is_within_1km(shifter_row['Start_lat'], shifter_row['Start_lon'], valid_riders_df) or is_within_1km(shifter_row['Start_lat'], shifter_row['Start_lon'], valid_shifters_df):
-            valid_shifter_indices.append(shifter_idx)
-
-    # Create DataFrames with the valid indices
-    newvalid_drivers_df = valid_drivers_df.loc[valid_driver_indices]
-    newvalid_riders_df = valid_riders_df.loc[valid_rider_indices]
-    newvalid_shifters_df = valid_shifters_df.loc[valid_shifter_indices]
-
-    # Save the filtered DataFrames to a new Excel file
-    with pd.ExcelWriter('UpdatedDataset.xlsx') as writer:
-        newvalid_drivers_df.to_excel(writer, sheet_name='Driver', index=False)
-        newvalid_riders_df.to_excel(writer, sheet_name='Rider', index=False)
-        newvalid_shifters_df.to_excel(writer, sheet_name='Shifter', index=False)
-
-filter_data_and_save()
+CHUNK_ROWS = 100_000
+ROLES = tuple(sheet.lower() for sheet in SHEETS)
+# The only columns the filter reads; the streaming mode keeps just these in memory
+INDEX_COLUMNS = ('type', 'departure_time', 'Start_lat', 'Start_lon')
+
+
+# Keep only participants that have a counterpart departing within time_window and starting
+# within radius_km. Takes DataFrames or participants.Participants stores and returns the
+# filtered driver, rider and shifter sheets in the same form.
+def filter_participants(drivers_df, riders_df, shifters_df, radius_km=1.0, time_window=TIME_WINDOW):
+
+    # Filter drivers, riders and shifters based on matching departure times
+    time_masks = departure_window_masks(drivers_df, riders_df, shifters_df, time_window)
+    starts = {role: (np.asarray(df['Start_lat'])[time_masks[role]], np.asarray(df['Start_lon'])[time_masks[role]])
+              for role, df in (('driver', drivers_df), ('rider', riders_df), ('shifter', shifters_df))}
+
+    # Spatial indexes over start coordinates answer "is anyone within radius_km" per row
+    indexes = {role: GridIndex(lat, lon, radius_km) for role, (lat, lon) in starts.items()}
+
+    def has_neighbour(role, *others):
+        lat, lon = starts[role]
+        mask = np.zeros(len(lat), dtype=bool)
+        for other in others:
+            mask[~mask] = indexes[other].any_within(lat[~mask], lon[~mask])
+        keep = time_masks[role].copy()
+        keep[keep] = mask
+        return np.nonzero(keep)[0]
+
+    # Drivers need a rider or shifter, riders a shifter or driver, shifters anyone
+    valid_driver_rows = has_neighbour('driver', 'rider', 'shifter')
+    valid_rider_rows = has_neighbour('rider', 'shifter', 'driver')
+    valid_shifter_rows = has_neighbour('shifter', 'driver', 'rider', 'shifter')
+
+    # DataFrame.take keeps the original index labels, as Participants.take keeps the row order
+    return drivers_df.take(valid_driver_rows), riders_df.take(valid_rider_rows), shifters_df.take(valid_shifter_rows)
+
+
+def filter_data_and_save(input_path='Dataset.xlsx', output_path='UpdatedDataset.xlsx', radius_km=1.0,
+                         time_window=TIME_WINDOW):
+    drivers_df, riders_df, shifters_df = load_dataset(input_path)
+    newvalid_drivers_df, newvalid_riders_df, newvalid_shifters_df = filter_participants(
+        drivers_df, riders_df, shifters_df, radius_km, time_window)
+
+    # Save the filtered DataFrames to a new Excel file (or a columnar bundle for any other extension)
+    save_dataset((newvalid_drivers_df, newvalid_riders_df, newvalid_shifters_df), output_path)
+
+
+def _columns(path):
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).schema_arrow.names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+# DataFrame chunks of a CSV or Parquet file holding every participant, roles told apart by the
+# 'type' column as in dataset_io.read_csv. Parquet needs pyarrow.
+def read_chunks(path, columns=None, chunksize=CHUNK_ROWS):
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            chunk = batch.to_pandas()
+            chunk['departure_time'] = pd.to_datetime(chunk['departure_time'])
+            yield chunk
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize, parse_dates=['departure_time'])
+
+
+# Appends chunks to a CSV or Parquet file as they come, so the output is never held in memory
+class _ChunkWriter:
+    def __init__(self, path):
+        self.path = path
+        self.parquet = None
+        self.started = False
+        self.empty = None
+
+    def write(self, chunk):
+        if self.path.endswith('.parquet'):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self.parquet is None and len(chunk) == 0:
+                self.empty = chunk  # An all-missing column has no type to fix the schema with yet
+                return
+            if self.parquet is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                self.parquet = pq.ParquetWriter(self.path, table.schema)
+            else:
+                table = pa.Table.from_pandas(chunk, schema=self.parquet.schema, preserve_index=False)
+            self.parquet.write_table(table)
+        else:
+            chunk.to_csv(self.path, mode='a' if self.started else 'w', header=not self.started, index=False)
+        self.started = True
+
+    def close(self):
+        if self.parquet is not None:
+            self.parquet.close()
+        elif self.empty is not None:  # Nothing survived
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            pq.write_table(pa.Table.from_pandas(self.empty, preserve_index=False), self.path)
+
+
+# filter_participants for CSV or Parquet files too large to load. The first pass reads only
+# the type, departure time, start coordinates (and flexibility) of each row into one compact
+# frame per role; filter_participants sorts those times and buckets the start points exactly
+# as it does for whole datasets. The second pass reads the file again chunk by chunk and
+# appends the surviving rows, unchanged and in file order, to output_path (.csv or .parquet).
+# Peak memory is the index (about 30 bytes a participant) plus one chunk, whatever the number
+# of other columns. Returns the number of participants kept per role.
+def stream_filter_and_save(input_path, output_path, radius_km=1.0, time_window=TIME_WINDOW, chunksize=CHUNK_ROWS):
+    if os.path.abspath(input_path) == os.path.abspath(output_path):
+        raise ValueError('The output would overwrite the input while it is being read')
+    columns = list(INDEX_COLUMNS)
+    if FLEXIBILITY_COLUMN in _columns(input_path):
+        columns.append(FLEXIBILITY_COLUMN)
+
+    parts = {role: [] for role in ROLES}
+    for chunk in read_chunks(input_path, columns, chunksize):
+        roles = chunk.pop('type').astype(str).str.lower()
+        for role in ROLES:
+            parts[role].append(chunk[(roles == role).to_numpy()])
+    index = [pd.concat(parts.pop(role), ignore_index=True) for role in ROLES]
+
+    # The surviving rows' positions among their role's rows, as a mask over those rows
+    kept = filter_participants(*index, radius_km=radius_km, time_window=time_window)
+    keep = {}
+    for role, df, survivors in zip(ROLES, index, kept):
+        keep[role] = np.zeros(len(df), dtype=bool)
+        keep[role][survivors.index.to_numpy()] = True
+    del index, kept
+
+    seen = dict.fromkeys(ROLES, 0)
+    writer = _ChunkWriter(output_path)
+    try:
+        for chunk in read_chunks(input_path, chunksize=chunksize):
+            roles = chunk['type'].astype(str).str.lower().to_numpy()
+            mask = np.zeros(len(chunk), dtype=bool)
+            for role in ROLES:
+                rows = roles == role
+                n = np.count_nonzero(rows)
+                mask[rows] = keep[role][seen[role]:seen[role] + n]
+                seen[role] += n
+            writer.write(chunk[mask])
+    finally:
+        writer.close()
+    return {role: int(np.count_nonzero(mask)) for role, mask in keep.items()}
+
+
+if __name__ == '__main__':
+    filter_data_and_save()
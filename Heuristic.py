@@ -0,0 +1,61 @@
+import glob
+import time
+import warnings
+
+import cpsat_backend
+from assignment_table import write_table
+from candidate_edges import build_candidate_edges
+from dataset_io import load_dataset
+from heuristic_backend import optimality_gap, solve_edges
+from pipeline import solve_dataset
+from time_windows import TIME_WINDOW
+
+warnings.filterwarnings('ignore')
+
+DATASET = 'Datasets/Filtered(15).xlsx'
+
+
+# Greedy matching plus local search over the candidate edges, no solver licence needed.
+# instrument is an optional Instrumentation that collects the phase timings.
+# output is an optional .csv, .parquet or .json path for the table of matches (see
+# assignment_table.py); without it the table is printed.
+# dataset is the workbook, CSV file or bundle to solve (see pipeline.solve_dataset).
+# time_window and distance are the matching rules, as in the other scripts.
+def solve(tolerance, instrument=None, output=None, dataset=DATASET, time_window=TIME_WINDOW, distance=None):
+    start_time_total = time.time()
+    result = solve_dataset(dataset, 'heuristic', tolerance, time_window, instrument=instrument, distance=distance)
+    print("Heuristic solution found (not necessarily optimal).")
+    print("Objective value:", result['objective'])
+
+    table = result['table']
+    if output is not None:
+        write_table(table, output)
+        print('Matches written to', output)
+    else:
+        print(table.to_string(index=False))
+    match_count = len(table)
+
+    end_time_total = time.time()
+    print('Match Count:', match_count)
+    print('Edge build time:', round(result['precompute_time'], 2), 'seconds')
+    print('Solution time:', round(result['solve_time'], 4), 'seconds')
+    print('Total execution time:', round(end_time_total - start_time_total, 2), 'seconds')
+
+
+# Compare the heuristic with the exact CP-SAT model on every bundled Filtered(N) dataset
+def gap_report(tolerance, pattern='Datasets/Filtered(*).xlsx'):
+    paths = sorted(glob.glob(pattern), key=lambda p: int(p.split('(')[-1].split(')')[0]))
+    print('Dataset', 'Heuristic', 'Exact', 'Gap %', 'Heuristic time', 'Exact time', sep='\t')
+    for path in paths:
+        d_df, r_df, s_df = load_dataset(path)
+        edges = build_candidate_edges(d_df, r_df, s_df, tolerance)
+        args = (edges, d_df['seats'].tolist(), s_df['seats'].tolist(), len(r_df))
+        heuristic = solve_edges(*args)
+        exact = cpsat_backend.solve_edges(*args)
+        gap = optimality_gap(heuristic['objective'], exact['objective'])
+        print(path, heuristic['objective'], exact['objective'], round(100 * gap, 2),
+              round(heuristic['solve_time'], 4), round(exact['solve_time'], 2), sep='\t')
+
+
+if __name__ == '__main__':
+    solve(tolerance=1)
@@ -0,0 +1,73 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from distances import PAIR_ROLES, ROLE_PAIRS, haversine
+
+FORMATS = ('.csv', '.parquet', '.json')
+
+
+def _column(df, name):
+    return np.asarray(df[name])
+
+
+# The chosen matches of a result as one typed table, one row per match:
+#   role_pair     category of distances.ROLE_PAIRS
+#   provider_id   id of the driver, or of the shifter acting as a driver
+#   passenger_id  id of the rider, or of the shifter acting as a rider
+#   distance_km   the larger of the start and end distances (what the tolerance is tested on)
+#   time_delta    passenger departure minus provider departure
+# drivers, riders and shifters are DataFrames or participants.Participants stores. Every column
+# is computed with one vectorized pass per role pair over the assignment's index arrays.
+def assignment_table(assignment, drivers, riders, shifters):
+    sheets = {'driver': drivers, 'rider': riders, 'shifter': shifters}
+    parts = []
+    for pair in ROLE_PAIRS:
+        provider_role, passenger_role = PAIR_ROLES[pair]
+        provider, passenger = sheets[provider_role], sheets[passenger_role]
+        pairs = np.array(assignment.get(pair, []), dtype=np.int64).reshape(-1, 2)
+        i, j = pairs[:, 0], pairs[:, 1]
+        start = haversine(_column(provider, 'Start_lat')[i], _column(provider, 'Start_lon')[i],
+                          _column(passenger, 'Start_lat')[j], _column(passenger, 'Start_lon')[j])
+        end = haversine(_column(provider, 'End_lat')[i], _column(provider, 'End_lon')[i],
+                        _column(passenger, 'End_lat')[j], _column(passenger, 'End_lon')[j])
+        provider_times = pd.to_datetime(provider['departure_time']).to_numpy(dtype='datetime64[ns]')
+        passenger_times = pd.to_datetime(passenger['departure_time']).to_numpy(dtype='datetime64[ns]')
+        parts.append(pd.DataFrame({
+            'role_pair': np.full(len(pairs), pair, dtype=object),
+            'provider_id': _column(provider, 'id')[i].astype(str),
+            'passenger_id': _column(passenger, 'id')[j].astype(str),
+            'distance_km': np.maximum(start, end),
+            'time_delta': passenger_times[j] - provider_times[i],
+        }))
+    table = pd.concat(parts, ignore_index=True)
+    table['role_pair'] = pd.Categorical(table['role_pair'], categories=ROLE_PAIRS)
+    table['time_delta'] = table['time_delta'].astype('timedelta64[ns]')
+    return table
+
+
+# Write an assignment table in one call, in the format given by the file extension: .csv,
+# .parquet (needs pyarrow or fastparquet) or .json (a list of records). Time deltas are
+# written as seconds in CSV and JSON.
+def write_table(table, path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError('Unknown output format %r, expected one of %s' % (extension, ', '.join(FORMATS)))
+    if extension == '.parquet':
+        table.to_parquet(path, index=False)
+        return
+    flat = table.assign(role_pair=table['role_pair'].astype(str),
+                        time_delta=table['time_delta'].dt.total_seconds())
+    if extension == '.csv':
+        flat.to_csv(path, index=False)
+    else:
+        with open(path, 'w') as f:
+            json.dump(flat.to_dict('records'), f, indent=1)
+
+
+# Matches per role pair, for a one-line summary instead of one line per match
+def match_counts(table):
+    counts = table['role_pair'].value_counts(sort=False)
+    return {pair: int(counts[pair]) for pair in ROLE_PAIRS}
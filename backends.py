@@ -0,0 +1,15 @@
+import importlib
+
+# Solver backends by name. Each module exposes solve_edges() with the same signature and
+# result format, and is only imported when asked for so Gurobi stays optional.
+BACKENDS = {
+    'cpsat': 'cpsat_backend',
+    'gurobi': 'gurobi_backend',
+    'heuristic': 'heuristic_backend',
+}
+
+
+def get_backend(name):
+    if name not in BACKENDS:
+        raise ValueError('Unknown backend %r, expected one of %s' % (name, ', '.join(BACKENDS)))
+    return importlib.import_module(BACKENDS[name])
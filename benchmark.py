@@ -0,0 +1,137 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import glob
+import json
+import os
+import resource
+import time
+import warnings
+
+from backends import get_backend
+from candidate_edges import build_candidate_edges
+from dataset_io import load_dataset
+from solver_config import FORMULATIONS, SolverConfig
+
+warnings.filterwarnings('ignore')
+
+DEFAULT_PATTERNS = ('Datasets/Filtered(*).xlsx', 'Datasets/Dataset(*).xlsx')
+DEFAULT_BACKENDS = ('cpsat', 'gurobi', 'heuristic', 'preprocess')
+DEFAULT_TOLERANCES = (1, 5, 20)
+EXACT_BACKENDS = ('cpsat', 'gurobi')
+
+FIELDS = ['dataset', 'backend', 'formulation', 'tolerance', 'status', 'error', 'n_drivers', 'n_riders',
+          'n_shifters', 'edges', 'variables', 'constraints', 'objective', 'bound', 'gap', 'nodes', 'load_time',
+          'precompute_time', 'build_time', 'solve_time', 'extract_time', 'total_time', 'peak_rss_mb']
+
+
+# Dataset size from names like 'Filtered(400).xlsx', so runs go smallest first
+def dataset_size(path):
+    try:
+        return int(os.path.basename(path).split('(')[-1].split(')')[0])
+    except ValueError:
+        return 0
+
+
+def find_datasets(patterns=DEFAULT_PATTERNS):
+    paths = {path for pattern in patterns for path in glob.glob(pattern)}
+    return sorted(paths, key=lambda p: (dataset_size(p), p))
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# One benchmark case. Runs in a fresh worker process so peak RSS belongs to this case alone.
+# backend 'preprocess' times Data_preprocesser.filter_participants instead of a solver, with
+# the tolerance used as its proximity radius.
+def run_case(path, backend_name, tolerance, time_limit=None, formulation='standard'):
+    row = dict.fromkeys(FIELDS)
+    row.update(dataset=path, backend=backend_name, formulation=formulation, tolerance=tolerance)
+    start_time_total = time.time()
+    try:
+        start_time = time.time()
+        drivers_df, riders_df, shifters_df = load_dataset(path)
+        row['load_time'] = time.time() - start_time
+        row.update(n_drivers=len(drivers_df), n_riders=len(riders_df), n_shifters=len(shifters_df))
+
+        if backend_name == 'preprocess':
+            from Data_preprocesser import filter_participants
+            start_time = time.time()
+            filtered = filter_participants(drivers_df, riders_df, shifters_df, radius_km=tolerance)
+            row['precompute_time'] = time.time() - start_time
+            row['status'] = 'DONE'
+            row['objective'] = sum(len(df) for df in filtered)
+        else:
+            backend = get_backend(backend_name)
+            start_time = time.time()
+            edges = build_candidate_edges(drivers_df, riders_df, shifters_df, tolerance)
+            row['precompute_time'] = time.time() - start_time
+            row['edges'] = sum(len(pairs) for pairs in edges.values())
+
+            result = backend.solve_edges(edges, drivers_df['seats'].tolist(), shifters_df['seats'].tolist(),
+                                         len(riders_df), log_output=False,
+                                         config=SolverConfig(time_limit=time_limit, formulation=formulation))
+            for key in ('status', 'objective', 'bound', 'gap', 'nodes', 'variables', 'constraints',
+                        'build_time', 'solve_time', 'extract_time'):
+                row[key] = result[key]
+    except Exception as error:  # A missing licence or solver must not stop the whole sweep
+        row['status'] = 'ERROR'
+        row['error'] = '%s: %s' % (type(error).__name__, error)
+    row['total_time'] = time.time() - start_time_total
+    row['peak_rss_mb'] = _peak_rss_mb()
+    return row
+
+
+def write_results(rows, output):
+    if output.endswith('.json'):
+        with open(output, 'w') as f:
+            json.dump(rows, f, indent=2)
+    else:
+        with open(output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+# Run every dataset x backend x tolerance case, one worker process per case. The exact backends
+# run once per formulation; the heuristic and the preprocessor have no model to vary.
+def run_benchmarks(datasets, backends=DEFAULT_BACKENDS, tolerances=DEFAULT_TOLERANCES, time_limit=None, jobs=1,
+                   formulations=('standard',)):
+    cases = [(path, backend, tolerance, formulation) for path in datasets for backend in backends
+             for formulation in (formulations if backend in EXACT_BACKENDS else ('standard',))
+             for tolerance in tolerances]
+    rows = []
+    with ProcessPoolExecutor(max_workers=jobs, max_tasks_per_child=1) as pool:
+        futures = [pool.submit(run_case, path, backend, tolerance, time_limit, formulation)
+                   for path, backend, tolerance, formulation in cases]
+        for future in futures:
+            row = future.result()
+            rows.append(row)
+            print(row['dataset'], row['backend'], row['formulation'], row['tolerance'], row['status'],
+                  row['objective'], row['nodes'], round(row['total_time'], 2), 'seconds', sep='\t', flush=True)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time loading, edge building, model building, solving and '
+                                                 'extraction for every dataset, backend and tolerance.')
+    parser.add_argument('--datasets', nargs='+', default=list(DEFAULT_PATTERNS), help='Glob patterns of workbooks')
+    parser.add_argument('--backends', nargs='+', default=list(DEFAULT_BACKENDS))
+    parser.add_argument('--tolerances', nargs='+', type=float, default=list(DEFAULT_TOLERANCES))
+    parser.add_argument('--formulations', nargs='+', choices=FORMULATIONS, default=['standard'],
+                        help='Model formulations to compare on the exact backends')
+    parser.add_argument('--time-limit', type=float, default=None, help='Per-solve wall-clock limit in seconds')
+    parser.add_argument('--jobs', type=int, default=1, help='Cases run at once (timings are noisier above 1)')
+    parser.add_argument('--output', default='benchmark_results.csv', help='.csv or .json')
+    args = parser.parse_args()
+
+    rows = run_benchmarks(find_datasets(args.datasets), args.backends, args.tolerances, args.time_limit, args.jobs,
+                          args.formulations)
+    write_results(rows, args.output)
+    print('Results written to', args.output)
+
+
+if __name__ == '__main__':
+    main()
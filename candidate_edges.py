@@ -0,0 +1,96 @@
+import numpy as np
+
+from distances import PAIR_ROLES, role_distance_matrices
+from instrumentation import Instrumentation
+from preferences import role_preference_masks
+from time_windows import TIME_WINDOW, departure_ns, flexibility_ns, window_mask
+
+
+# Departure times and flexibilities of one sheet, both int64 nanoseconds
+def _times(df):
+    return departure_ns(df), flexibility_ns(df)
+
+
+def _pairs(provider, passenger, within_tolerance, compatible, time_window, skip_self=False):
+    # Time window, distance and preferences are all checked for every pair at once
+    in_window = window_mask(provider[0], passenger[0], time_window, provider[1], passenger[1])
+    mask = in_window & within_tolerance & compatible
+    if skip_self:
+        np.fill_diagonal(mask, False)
+    rows, cols = np.nonzero(mask)
+    return list(zip(rows.tolist(), cols.tolist()))
+
+
+# Build the list of (provider, passenger) index pairs that pass the time window, distance
+# tolerance and preference rules. Only these pairs get a decision variable in the solvers.
+# The time window is widened per pair by the participants' flexibility (see time_windows.py),
+# and distance is a provider from distances.py (haversine by default, or e.g. a
+# postcode_distances.PostcodeDistanceTable), with the tolerance in its unit.
+# instrument (an Instrumentation) receives the time spent in each stage.
+def build_candidate_edges(drivers_df, riders_df, shifters_df, tolerance, time_window=TIME_WINDOW, instrument=None,
+                          distance=None):
+    instrument = instrument or Instrumentation()
+    with instrument.phase('distance_matrix'):
+        within = role_distance_matrices(drivers_df, riders_df, shifters_df, tolerance=tolerance, distance=distance)
+    with instrument.phase('preference_masks'):
+        compatible = role_preference_masks(drivers_df, riders_df, shifters_df)
+    with instrument.phase('datetime_parsing'):
+        driver_times, rider_times, shifter_times = _times(drivers_df), _times(riders_df), _times(shifters_df)
+
+    with instrument.phase('edge_filter'):
+        return {
+            'driver_rider': _pairs(driver_times, rider_times, within['driver_rider'], compatible['driver_rider'],
+                                   time_window),
+            'shifter_rider': _pairs(shifter_times, rider_times, within['shifter_rider'],
+                                    compatible['shifter_rider'], time_window),
+            'driver_shifter': _pairs(driver_times, shifter_times, within['driver_shifter'],
+                                     compatible['driver_shifter'], time_window),
+            'shifter_shifter': _pairs(shifter_times, shifter_times, within['shifter_shifter'],
+                                      compatible['shifter_shifter'], time_window, skip_self=True),
+        }
+
+
+# Candidate pairs for every tolerance at once: every pair that passes the time window and
+# preference rules, with the larger of its start and end distances. A pair is within a
+# tolerance when that distance is, so threshold_edges() turns this into the edges of any
+# tolerance without computing a distance again. time_window and distance are as in
+# build_candidate_edges.
+def candidate_distances(drivers_df, riders_df, shifters_df, time_window=TIME_WINDOW, instrument=None, distance=None):
+    instrument = instrument or Instrumentation()
+    with instrument.phase('distance_matrix'):
+        distances = role_distance_matrices(drivers_df, riders_df, shifters_df, distance=distance)
+    with instrument.phase('preference_masks'):
+        compatible = role_preference_masks(drivers_df, riders_df, shifters_df)
+    with instrument.phase('datetime_parsing'):
+        times = {'driver': _times(drivers_df), 'rider': _times(riders_df), 'shifter': _times(shifters_df)}
+
+    candidates = {}
+    with instrument.phase('edge_filter'):
+        for pair, (provider_role, passenger_role) in PAIR_ROLES.items():
+            provider_times, provider_flex = times[provider_role]
+            passenger_times, passenger_flex = times[passenger_role]
+            mask = window_mask(provider_times, passenger_times, time_window, provider_flex, passenger_flex)
+            mask &= compatible[pair]
+            if pair == 'shifter_shifter':
+                np.fill_diagonal(mask, False)
+            rows, cols = np.nonzero(mask)
+            start, end = distances[pair]
+            candidates[pair] = (rows, cols, np.maximum(start[rows, cols], end[rows, cols]))
+    return candidates
+
+
+# Edges of one tolerance from candidate_distances(), in the order build_candidate_edges gives
+def threshold_edges(candidates, tolerance):
+    edges = {}
+    for pair, (rows, cols, distance) in candidates.items():
+        keep = distance <= tolerance
+        edges[pair] = list(zip(rows[keep].tolist(), cols[keep].tolist()))
+    return edges
+
+
+# Group edges by one endpoint: side=0 groups by provider, side=1 by passenger
+def edges_by_node(pairs, n, side):
+    grouped = [[] for _ in range(n)]
+    for pair in pairs:
+        grouped[pair[side]].append(pair)
+    return grouped
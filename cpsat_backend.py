@@ -0,0 +1,256 @@
+from collections import Counter
+
+from ortools.sat.python import cp_model
+import time
+
+from candidate_edges import edges_by_node
+from instrumentation import Instrumentation, record_edge_variables
+from solver_config import SolverConfig, relative_gap
+from warm_start import active_shifters, assignment_size
+
+
+# Constraint emission: builds the CP-SAT model from precomputed candidate edges.
+# driver_seats / shifter_seats give the capacity of every driver and shifter.
+# rider_counts optionally gives how many identical riders each rider index stands for (see
+# presolve.py); their edge variables then range over 0..count. instrument (an Instrumentation)
+# receives variable counts and the time and size of each constraint family.
+# formulation='strong' builds the same model with a tighter LP relaxation: every y[i][j] is
+# linked to z[i] on its own, a driving shifter's ride-once row is folded into its role row, and
+# the w capacity/once rows implied by the w role row are left out.
+def build_model(edges, driver_seats, shifter_seats, n_riders, instrument=None, rider_counts=None,
+                formulation='standard'):
+    instrument = instrument or Instrumentation()
+    model = cp_model.CpModel()
+
+    n_drivers = len(driver_seats)
+    n_shifters = len(shifter_seats)
+    rider_counts = rider_counts or [1] * n_riders
+    # Shifters with no candidate rider can never act as drivers, so they get no z
+    drivable = sorted({i for i, _ in edges['shifter_rider']})
+    strong = formulation == 'strong'
+
+    # Define decision variables
+    with instrument.phase('variables'):
+        x = {(i, j): model.NewIntVar(0, rider_counts[j], 'x[%i][%i]' % (i, j)) for i, j in edges['driver_rider']} #Driver and Rider assignment
+        y = {(i, j): model.NewIntVar(0, rider_counts[j], 'y[%i][%i]' % (i, j)) for i, j in edges['shifter_rider']} #Shifter and Rider assignment
+        z = {i: model.NewIntVar(0, 1, 'z[%i]' % i) for i in drivable} #Check if the Shifter is active/assigned
+        y_rider = {(i, j): model.NewIntVar(0, 1, 'y_rider[%i][%i]' % (i, j)) for i, j in edges['driver_shifter']} #Driver and Shifter ( acting as rider) assignment.
+        w = {(i, j): model.NewIntVar(0, 1, 'w[%i][%i]' % (i, j)) for i, j in edges['shifter_shifter']} # shifter (acting driver) has been assigned to shifter (acting rider)
+    record_edge_variables(instrument, edges, n_drivers, n_shifters, n_riders)
+
+    x_by_driver = edges_by_node(x, n_drivers, 0)
+    x_by_rider = edges_by_node(x, n_riders, 1)
+    y_by_shifter = edges_by_node(y, n_shifters, 0)
+    y_by_rider = edges_by_node(y, n_riders, 1)
+    y_rider_by_driver = edges_by_node(y_rider, n_drivers, 0)
+    y_rider_by_shifter = edges_by_node(y_rider, n_shifters, 1)
+    w_by_driver = edges_by_node(w, n_shifters, 0)
+    w_by_rider = edges_by_node(w, n_shifters, 1)
+
+    # Each rider is taken by at most one driver or shifter acting as a driver
+    with instrument.constraint_family('rider_once', n_riders) as emitted:
+        for j in range(n_riders):
+            if x_by_rider[j] or y_by_rider[j]:
+                model.Add(sum(x[e] for e in x_by_rider[j]) + sum(y[e] for e in y_by_rider[j]) <= rider_counts[j])
+                emitted()
+
+    # Each shifter, when acting as a rider, is taken by at most one driver
+    with instrument.constraint_family('shifter_ride_once', n_shifters) as emitted:
+        for j in range(n_shifters):
+            if y_rider_by_shifter[j] and not (strong and j in z):
+                model.Add(sum(y_rider[e] for e in y_rider_by_shifter[j]) <= 1)
+                emitted()
+
+    # Each driver takes riders up to their capacity
+    with instrument.constraint_family('driver_capacity', n_drivers) as emitted:
+        for i in range(n_drivers):
+            if x_by_driver[i] or y_rider_by_driver[i]:
+                model.Add(sum([x[e] for e in x_by_driver[i]] + [y_rider[e] for e in y_rider_by_driver[i]]) <= int(
+                    driver_seats[i]))
+                emitted()
+
+    # Each shifter, when acting as a driver, takes riders up to their capacity
+    with instrument.constraint_family('shifter_capacity', n_shifters) as emitted:
+        for i in drivable:
+            model.Add(sum(y[e] for e in y_by_shifter[i]) <= int(shifter_seats[i]) * z[i])
+            emitted()
+
+    # Strong formulation: a shifter takes a rider only when acting as a driver
+    if strong:
+        with instrument.constraint_family('shifter_link', len(y)) as emitted:
+            for (i, j), var in y.items():
+                model.Add(var <= min(rider_counts[j], int(shifter_seats[i])) * z[i])
+                emitted()
+
+    # A shifter cannot act as both a driver and a rider at the same time
+    with instrument.constraint_family('shifter_role', n_shifters) as emitted:
+        for i in drivable:
+            model.Add(z[i] + sum(y_rider[e] for e in y_rider_by_shifter[i]) <= 1)
+            emitted()
+
+    # Each shifter-driver can take shifter-riders up to their capacity
+    with instrument.constraint_family('shifter_pair_capacity', n_shifters) as emitted:
+        for i in range(n_shifters):
+            if w_by_driver[i] and (not strong or int(shifter_seats[i]) < 1):
+                model.Add(sum(w[e] for e in w_by_driver[i]) <= int(shifter_seats[i]))
+                emitted()
+
+    # Each shifter-rider is taken by at most one shifter-driver
+    with instrument.constraint_family('shifter_pair_once', n_shifters) as emitted:
+        for j in range(n_shifters):
+            if w_by_rider[j] and not strong:
+                model.Add(sum(w[e] for e in w_by_rider[j]) <= 1)
+                emitted()
+
+    # A shifter cannot act as both a driver and a rider at the same time
+    with instrument.constraint_family('shifter_pair_role', n_shifters) as emitted:
+        for i in range(n_shifters):
+            if w_by_driver[i] or w_by_rider[i]:
+                model.Add(sum(w[e] for e in w_by_driver[i]) + sum(w[e] for e in w_by_rider[i]) <= 1)
+                emitted()
+
+    # Objective
+    total_matches = sum(x.values()) + sum(y.values()) + sum(w.values()) + sum(y_rider.values())
+
+    model.Maximize(total_matches)
+
+    variables = {'driver_rider': x, 'shifter_rider': y, 'driver_shifter': y_rider, 'shifter_shifter': w}
+    return model, variables, z
+
+
+# Seed the search with a known assignment (e.g. from warm_start.greedy_assignment). An edge
+# listed k times hints the value k.
+def add_hint(model, variables, z, hint):
+    for pair, pair_vars in variables.items():
+        chosen = Counter(hint[pair])
+        for edge, var in pair_vars.items():
+            model.AddHint(var, chosen[edge])
+    active = set(active_shifters(hint))
+    for i, var in z.items():
+        model.AddHint(var, int(i in active))
+
+
+# Translate a SolverConfig into CP-SAT parameters
+def apply_config(cp_solver, config):
+    parameters = cp_solver.parameters
+    if config.threads is not None:
+        parameters.num_workers = config.threads
+    if config.relative_gap is not None:
+        parameters.relative_gap_limit = config.relative_gap
+    if config.time_limit is not None:
+        parameters.max_time_in_seconds = config.time_limit
+    if config.work_limit is not None:
+        parameters.max_deterministic_time = config.work_limit
+    if config.deterministic:
+        parameters.random_seed = config.seed
+        parameters.interleave_search = True
+
+
+# Solve a built model and extract the result in the format shared by every backend. hint is
+# the assignment the model was hinted with, if any.
+def _solve_model(model, variables, hint, build_time, log_output, config, instrument):
+    cp_solver = cp_model.CpSolver()
+    cp_solver.parameters.log_search_progress = log_output
+    apply_config(cp_solver, config)
+
+    start_time_solver = time.time()
+    status = cp_solver.Solve(model)
+    end_time_solver = time.time()
+    instrument.record_phase('solve', end_time_solver - start_time_solver)
+    instrument.record_solver(NumBranches=cp_solver.NumBranches(), NumConflicts=cp_solver.NumConflicts(),
+                             WallTime=cp_solver.WallTime(), UserTime=cp_solver.UserTime())
+
+    start_time_extract = time.time()
+    proto = model.Proto()
+    result = {
+        'status': cp_solver.StatusName(status),
+        'objective': None,
+        'bound': None,
+        'gap': None,
+        'nodes': cp_solver.NumBranches(),
+        'assignment': {pair: [] for pair in variables},
+        'variables': len(proto.variables),
+        'constraints': len(proto.constraints),
+        'build_time': build_time,
+        'solve_time': end_time_solver - start_time_solver,
+    }
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        result['objective'] = cp_solver.ObjectiveValue()
+        result['bound'] = cp_solver.BestObjectiveBound()
+        result['gap'] = relative_gap(result['objective'], result['bound'])
+        # CP-SAT reports OPTIMAL once relative_gap_limit is met; only a closed gap is optimal here
+        if result['gap'] > 1e-9:
+            result['status'] = 'FEASIBLE'
+        # One bulk read per role pair over the created edge variables only
+        for pair, pair_vars in variables.items():
+            values = cp_solver.Values(list(pair_vars.values())).tolist() if pair_vars else []
+            result['assignment'][pair] = [edge for edge, value in zip(pair_vars, values) for _ in range(value)]
+    elif status == cp_model.UNKNOWN and hint is not None:
+        # The limit hit before CP-SAT found a solution of its own; the hint is still a valid incumbent
+        result['status'] = 'FEASIBLE'
+        result['objective'] = float(assignment_size(hint))
+        result['assignment'] = {pair: list(hint[pair]) for pair in variables}
+    result['extract_time'] = time.time() - start_time_extract
+    instrument.record_phase('extract', result['extract_time'])
+    return result
+
+
+# Build and solve one instance. The assignment maps each role pair to its chosen (i, j) edges.
+# hint is an optional assignment in the same format used as the starting solution, and fixed
+# an optional set of edges in the same format that must stay in the solution.
+# config (a SolverConfig) sets the time limit, workers, gap, determinism and formulation.
+# instrument (an Instrumentation) receives the phase timings, model counts and search statistics.
+# With rider_counts, an edge appears in the assignment once per rider it carries.
+def solve_edges(edges, driver_seats, shifter_seats, n_riders, log_output=False, hint=None, config=None,
+                fixed=None, instrument=None, rider_counts=None):
+    instrument = instrument or Instrumentation()
+    config = config or SolverConfig()
+
+    start_time_build = time.time()
+    model, variables, z = build_model(edges, driver_seats, shifter_seats, n_riders, instrument, rider_counts,
+                                      config.formulation)
+    if hint is not None:
+        add_hint(model, variables, z, hint)
+    if fixed is not None:
+        for pair, pairs in fixed.items():
+            for edge in pairs:
+                model.Add(variables[pair][edge] == 1)
+    end_time_build = time.time()
+    instrument.record_phase('build', end_time_build - start_time_build)
+
+    return _solve_model(model, variables, hint, end_time_build - start_time_build, log_output, config, instrument)
+
+
+# Solve one instance at several tolerances with a single model. edges are the candidate edges
+# of the largest tolerance and edge_distances[pair][k] the distance of edges[pair][k]. The
+# tolerances are solved smallest first: edges beyond the current tolerance get an upper bound
+# of 0, and every solve is hinted with the previous solution, which stays feasible as the
+# tolerance grows. Yields (tolerance, result) in that order.
+def solve_tolerances(edges, edge_distances, driver_seats, shifter_seats, n_riders, tolerances, log_output=False,
+                     config=None, instrument=None):
+    instrument = instrument or Instrumentation()
+    config = config or SolverConfig()
+
+    start_time_build = time.time()
+    model, variables, z = build_model(edges, driver_seats, shifter_seats, n_riders, instrument,
+                                      formulation=config.formulation)
+    domains = {pair: [model.Proto().variables[var.Index()].domain for var in pair_vars.values()]
+               for pair, pair_vars in variables.items()}
+    build_time = time.time() - start_time_build
+    instrument.record_phase('build', build_time)
+
+    hint = None
+    for tolerance in sorted(tolerances):
+        start_time_build = time.time()
+        for pair, pair_domains in domains.items():
+            for domain, distance in zip(pair_domains, edge_distances[pair]):
+                domain[1] = 1 if distance <= tolerance else 0
+        model.ClearHints()
+        if hint is not None:
+            add_hint(model, variables, z, hint)
+        build_time += time.time() - start_time_build
+        result = _solve_model(model, variables, hint, build_time, log_output, config, instrument)
+        build_time = 0.0
+        if result['objective'] is not None:
+            hint = result['assignment']
+        yield tolerance, result
@@ -1,101 +1,135 @@
+import numpy as np
 import pandas as pd
-import random
-import math
-from datetime import datetime, timedelta
-
-# # Load the postcode data from the CSV file
-postcode_data = pd.read_csv('Reading postcode.csv')
-# Load the new postcode data within radius
-postcode_datanew = pd.read_csv('radius.csv')
-
-def generate_dataset(num_entries):
-    writer = pd.ExcelWriter('synthetic_datasetnew20.xlsx', engine='xlsxwriter')
-    
+
+from dataset_io import SHEETS, save_bundle
+
+# Postcodes across Reading, and the postcodes within a small radius used for the clustered half
+POSTCODE_PATH = 'Postcode Datasets/Reading postcode.csv'
+RADIUS_POSTCODE_PATH = 'Postcode Datasets/radius.csv'
+
+BASE_DATE = np.datetime64('2023-05-08T00:00')
+CHUNK_ROWS = 100_000
+
+COLUMNS = ['id', 'type', 'route_start', 'Start_lat', 'Start_lon', 'route_end', 'End_lat', 'End_lon',
+           'departure_time', 'seats', 'Pet', 'Smoker', 'Disable']
+
+
+# Postcode tables as (indices into the merged postcode list, postcodes, latitudes, longitudes).
+# Both tables index one sorted list, so postcode columns are categoricals over it.
+def _load_postcodes(*paths):
+    tables = [pd.read_csv(path, usecols=['Postcode', 'Latitude', 'Longitude']) for path in paths]
+    merged = pd.concat(tables, ignore_index=True)
+    names, first, inverse = np.unique(merged['Postcode'].to_numpy(dtype=str), return_index=True,
+                                      return_inverse=True)
+    lat = merged['Latitude'].to_numpy()[first]
+    lon = merged['Longitude'].to_numpy()[first]
+    bounds = np.cumsum([0] + [len(table) for table in tables])
+    return [inverse[a:b] for a, b in zip(bounds[:-1], bounds[1:])], names, lat, lon
+
+
+def _categorical(codes, categories):
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+# Rows [start, stop) of one sheet. The first num_near_same_time rows of every sheet depart
+# around 12:00 (a base time in 12:00-12:59 plus an offset of up to +-30 minutes) from the
+# radius.csv postcodes, with Pet/Smoker YES and Disable NO. Row i of every sheet shares the same
+# departure time: times_rng is replayed identically for each sheet. The remaining rows depart
+# at any minute of the day from any Reading postcode with random preferences (riders may also
+# answer BOTH for Pet and Smoker).
+def _generate_chunk(tab_name, start, stop, num_near_same_time, rng, times_rng, postcodes):
+    n = stop - start
+    row = np.arange(start, stop)
+    near = row < num_near_same_time
+    n_near = int(near.sum())
+    (near_table, table), names, lat, lon = postcodes
+
+    minutes = np.empty(n, dtype=np.int64)
+    minutes[:n_near] = 12 * 60 + times_rng.integers(0, 60, n_near) + times_rng.integers(-30, 31, n_near)
+    minutes[n_near:] = rng.integers(0, 24 * 60, n - n_near)
+
+    # Start and end postcode of every row
+    codes = np.where(near, near_table[rng.integers(0, len(near_table), (2, n))],
+                     table[rng.integers(0, len(table), (2, n))])
+
+    if tab_name in ('Driver', 'Shifter'):
+        seats = rng.integers(2, 7, n)
+    else:
+        seats = np.full(n, np.nan)
+
+    answers = ['NO', 'YES', 'BOTH'] if tab_name == 'Rider' else ['NO', 'YES']
+    pet = np.where(near, 1, rng.integers(0, len(answers), n))
+    smoker = np.where(near, 1, rng.integers(0, len(answers), n))
+    disable = np.where(near, 0, rng.integers(0, 2, n))
+
+    return pd.DataFrame({
+        'id': tab_name[0] + pd.Series(row).astype(str),
+        'type': _categorical(np.zeros(n, dtype=np.int8), [tab_name.lower()]),
+        'route_start': _categorical(codes[0], names),
+        'Start_lat': lat[codes[0]],
+        'Start_lon': lon[codes[0]],
+        'route_end': _categorical(codes[1], names),
+        'End_lat': lat[codes[1]],
+        'End_lon': lon[codes[1]],
+        'departure_time': BASE_DATE + minutes.astype('timedelta64[m]'),
+        'seats': seats,
+        'Pet': _categorical(pet, answers),
+        'Smoker': _categorical(smoker, answers),
+        'Disable': _categorical(disable, ['NO', 'YES']),
+    }, columns=COLUMNS)
+
+
+# Yield (sheet name, DataFrame chunk) for num_entries rows per sheet. The output depends only
+# on num_entries, seed and chunk_rows.
+def generate_chunks(num_entries, seed=0, chunk_rows=CHUNK_ROWS):
+    postcodes = _load_postcodes(RADIUS_POSTCODE_PATH, POSTCODE_PATH)
     num_near_same_time = int(num_entries * 0.50)
-    num_different_time = num_entries - num_near_same_time
-    
-    near_same_times = []
-    for i in range(num_near_same_time):
-        base_departure_time = datetime(2023, 5, 8, random.randint(12, 12), random.randint(0, 59), 0)
-        offset = timedelta(minutes=random.randint(-30, 30))
-        near_same_times.append(base_departure_time + offset)
-    
-    random.shuffle(near_same_times)
-    
-    pet_values_near_same = 'YES'
-    smoker_values_near_same = 'YES'
-    disable_values_near_same = 'NO'
-    
-    for tab_name in ['Driver', 'Rider', 'Shifter']:
-        df = pd.DataFrame(columns=['id', 'type', 'route_start', 'Start_lat', 'Start_lon', 'route_end', 'End_lat', 'End_lon', 'departure_time', 'seats', 'Pet', 'Smoker', 'Disable'])
-
-        for i in range(num_near_same_time):
-            departure_time = near_same_times[i]
-
-            # Select a start and end index from the list of possible indices in the near postcode data
-            start_index = random.randint(0, len(postcode_datanew) - 1)
-            end_index = random.randint(0, len(postcode_datanew) - 1)
-
-            seats = random.randint(2, 6) if tab_name in ['Driver', 'Shifter'] else None
-
-            row = {
-                'id': f'{tab_name[0]}{i}',
-                'type': tab_name.lower(),
-                'route_start': postcode_datanew['Postcode'][start_index],
-                'Start_lat': postcode_datanew['Latitude'][start_index],
-                'Start_lon': postcode_datanew['Longitude'][start_index],
-                'route_end': postcode_datanew['Postcode'][end_index],
-                'End_lat': postcode_datanew['Latitude'][end_index],
-                'End_lon': postcode_datanew['Longitude'][end_index],
-                'departure_time': departure_time.strftime('%Y-%m-%d %H:%M:%S'),
-                'seats': seats,
-                'Pet': pet_values_near_same,
-                'Smoker': smoker_values_near_same,
-                'Disable': disable_values_near_same
-            }
-            df = df.append(row, ignore_index=True)
-
-        for i in range(num_different_time):
-            departure_time = datetime(2023, 5, 8, random.randint(0, 23), random.randint(0, 59), 0)
-            
-            # Generate random indices for postcode data
-            start_index = random.randint(0, len(postcode_data) - 1)
-            end_index = random.randint(0, len(postcode_data) - 1)
-            
-            # Generate random number of seats (only for the Driver and Shifter tabs)
-            seats = random.randint(2, 6) if tab_name in ['Driver', 'Shifter'] else None
-            
-            # Generate random values for Pet, Smoker, and Disable columns
-            pet_values = ['YES', 'NO']
-            smoker_values = ['YES', 'NO']
-            disable_values = ['YES', 'NO']
-            
-            # Generate an entry for the current tab with random preferences
-            row = {
-                'id': f'{tab_name[0]}{i + num_near_same_time}',
-                'type': tab_name.lower(),
-                'route_start': postcode_data['Postcode'][start_index],
-                'Start_lat': postcode_data['Latitude'][start_index],
-                'Start_lon': postcode_data['Longitude'][start_index],
-                'route_end': postcode_data['Postcode'][end_index],
-                'End_lat': postcode_data['Latitude'][end_index],
-                'End_lon': postcode_data['Longitude'][end_index],
-                'departure_time': departure_time.strftime('%Y-%m-%d %H:%M:%S'),
-                'seats': seats,
-                'Pet': random.choice(pet_values + ['BOTH']) if tab_name == 'Rider' else random.choice(pet_values),
-                'Smoker': random.choice(smoker_values + ['BOTH']) if tab_name == 'Rider' else random.choice(smoker_values),
-                'Disable': random.choice(disable_values)
-            }
-            df = df.append(row, ignore_index=True)
-
-        # Save the dataframe to the current tab in the Excel file
-        df.to_excel(writer, sheet_name=tab_name, index=False)
-    
-    # Save and close the Excel writer object
-    writer.save()
-
-# Set the number of entries you want in the dataset
-num_entries = 20
-
-# Generate the dataset
-generate_dataset(num_entries)
+
+    times_seed, *sheet_seeds = np.random.SeedSequence(seed).spawn(1 + len(SHEETS))
+    for tab_name, sheet_seed in zip(SHEETS, sheet_seeds):
+        rng = np.random.default_rng(sheet_seed)
+        times_rng = np.random.default_rng(times_seed)
+        for start in range(0, max(num_entries, 1), chunk_rows):
+            stop = min(start + chunk_rows, num_entries)
+            yield tab_name, _generate_chunk(tab_name, start, stop, num_near_same_time, rng, times_rng, postcodes)
+
+
+# Write a synthetic dataset with num_entries drivers, riders and shifters. The format follows
+# the extension: '.xlsx' (written in chunks, one sheet per role), '.csv' (one file, roles told
+# apart by the 'type' column) or anything else for a columnar bundle (one sheet in memory at a
+# time). Use a bundle or CSV for large stress datasets: xlsx is slow and capped at ~1M rows.
+def generate_dataset(num_entries, output_path='synthetic_datasetnew20.xlsx', seed=0, chunk_rows=CHUNK_ROWS):
+    chunks = generate_chunks(num_entries, seed, chunk_rows)
+
+    if output_path.endswith('.xlsx'):
+        with pd.ExcelWriter(output_path) as writer:
+            rows_written = dict.fromkeys(SHEETS, 0)
+            for tab_name, df in chunks:
+                startrow = rows_written[tab_name] + (1 if rows_written[tab_name] else 0)
+                df.to_excel(writer, sheet_name=tab_name, index=False, header=not rows_written[tab_name],
+                            startrow=startrow)
+                rows_written[tab_name] += len(df)
+    elif output_path.endswith('.csv'):
+        with open(output_path, 'w', newline='') as f:
+            for k, (tab_name, df) in enumerate(chunks):
+                df.to_csv(f, index=False, header=k == 0)
+    else:
+        def sheets():
+            current, parts = None, []
+            for tab_name, df in chunks:
+                if tab_name != current and parts:
+                    yield pd.concat(parts, ignore_index=True)
+                    parts = []
+                current = tab_name
+                parts.append(df)
+            yield pd.concat(parts, ignore_index=True)
+
+        save_bundle(sheets(), output_path)
+
+
+if __name__ == '__main__':
+    # Set the number of entries you want in the dataset
+    num_entries = 20
+
+    # Generate the dataset
+    generate_dataset(num_entries)
@@ -0,0 +1,173 @@
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+SHEETS = ('Driver', 'Rider', 'Shifter')
+
+# Columnar dataset bundles: one directory per dataset, one sub-directory per sheet and one .npy
+# file per column, described by columns.json. Coordinates and other numbers are stored as they
+# are, departure times as int64 nanoseconds since the epoch and text (preferences, postcodes)
+# as small-int category codes. Text with too many distinct values to be worth coding (ids of
+# large datasets) is stored as fixed-width strings. Columns are memory-mapped on load, so
+# opening a bundle costs next to nothing whatever its size. xlsx and CSV stay the
+# import/export formats.
+BUNDLE_SUFFIX = '.npyd'
+METADATA_FILE = 'columns.json'
+TIME_COLUMNS = ('departure_time',)
+MAX_CATEGORIES = 1 << 15
+
+
+# Read the Driver, Rider and Shifter sheets of a workbook with parsed departure times
+def read_workbook(path):
+    sheets = pd.read_excel(path, sheet_name=list(SHEETS))  # One pass over the xlsx container
+    frames = []
+    for sheet in SHEETS:
+        df = sheets[sheet]
+        df['departure_time'] = pd.to_datetime(df['departure_time'])
+        frames.append(df)
+    return tuple(frames)
+
+
+# Read a single CSV holding every participant, split into sheets by its 'type' column (in any
+# case, as the streaming preprocessor and rolling horizon accept it)
+def read_csv(path):
+    df = pd.read_csv(path, parse_dates=['departure_time'])
+    types = df['type'].astype(str).str.lower()
+    return tuple(df[types == sheet.lower()].reset_index(drop=True) for sheet in SHEETS)
+
+
+def write_workbook(frames, path):
+    with pd.ExcelWriter(path) as writer:
+        for sheet, df in zip(SHEETS, frames):
+            df.to_excel(writer, sheet_name=sheet, index=False)
+
+
+def bundle_path(path):
+    return os.path.splitext(path)[0] + BUNDLE_SUFFIX
+
+
+def _code_dtype(n_categories):
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _write_sheet(df, directory):
+    os.makedirs(directory)
+    columns = []
+    for k, name in enumerate(df.columns):
+        series = df[name]
+        column = {'name': name, 'file': 'c%d.npy' % k}
+        if name in TIME_COLUMNS or pd.api.types.is_datetime64_any_dtype(series):
+            column['kind'] = 'time'
+            values = pd.to_datetime(series).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        elif pd.api.types.is_numeric_dtype(series) and not isinstance(series.dtype, pd.CategoricalDtype):
+            column['kind'] = 'number'
+            values = series.to_numpy()
+        elif isinstance(series.dtype, pd.CategoricalDtype) or series.nunique() < MAX_CATEGORIES:
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                categorical = series.array
+            else:
+                categorical = pd.Categorical(series.astype(object).where(series.notna(), None))
+            column['kind'] = 'category'
+            column['categories'] = [str(c) for c in categorical.categories]
+            values = categorical.codes.astype(_code_dtype(len(categorical.categories)))
+        else:
+            column['kind'] = 'text'  # Missing values are stored as ''
+            values = series.astype(object).where(series.notna(), '').to_numpy(dtype=str)
+        np.save(os.path.join(directory, column['file']), np.ascontiguousarray(values))
+        columns.append(column)
+    with open(os.path.join(directory, METADATA_FILE), 'w') as f:
+        json.dump({'rows': len(df), 'columns': columns}, f, indent=1)
+
+
+def _read_sheet(directory):
+    with open(os.path.join(directory, METADATA_FILE)) as f:
+        metadata = json.load(f)
+    data = {}
+    for column in metadata['columns']:
+        # Empty arrays cannot be memory-mapped
+        values = np.load(os.path.join(directory, column['file']), mmap_mode='r' if metadata['rows'] else None)
+        if column['kind'] == 'time':
+            values = values.view('datetime64[ns]')
+        elif column['kind'] == 'category':
+            values = pd.Categorical.from_codes(values, column['categories'])
+        elif column['kind'] == 'text':
+            values = pd.Series(values, dtype=object).replace('', None).to_numpy()
+        data[column['name']] = values
+    return pd.DataFrame(data, index=pd.RangeIndex(metadata['rows']), copy=False)
+
+
+# Write the three sheets as a bundle directory, replacing any existing one
+def save_bundle(frames, path):
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    for sheet, df in zip(SHEETS, frames):
+        _write_sheet(df.reset_index(drop=True), os.path.join(tmp_path, sheet))
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+def load_bundle(path):
+    return tuple(_read_sheet(os.path.join(path, sheet)) for sheet in SHEETS)
+
+
+# Load the Driver, Rider and Shifter DataFrames from a bundle, a workbook or a CSV file. A
+# workbook or CSV file is converted once into a bundle next to it (unless cache=False) and read
+# from there for as long as the bundle is newer than the source.
+def load_dataset(path, cache=True):
+    if os.path.isdir(path):
+        return load_bundle(path)
+    read = read_csv if path.endswith('.csv') else read_workbook
+    if not cache:
+        return read(path)
+    bundle = bundle_path(path)
+    if os.path.isdir(bundle) and os.path.getmtime(bundle) >= os.path.getmtime(path):
+        return load_bundle(bundle)
+    frames = read(path)
+    try:
+        save_bundle(frames, bundle)
+    except OSError:  # Read-only location: carry on without the cache
+        return frames
+    return load_bundle(bundle)
+
+
+# Write the three DataFrames as a workbook (.xlsx), a single CSV file (.csv) or, for any other
+# path, a bundle
+def save_dataset(frames, path):
+    if path.endswith('.xlsx'):
+        write_workbook(frames, path)
+    elif path.endswith('.csv'):
+        pd.concat(frames, ignore_index=True).to_csv(path, index=False)
+    else:
+        save_bundle(frames, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert datasets between xlsx workbooks or CSV files and '
+                                                 'columnar %s bundles.' % BUNDLE_SUFFIX)
+    parser.add_argument('inputs', nargs='+', help='Workbooks or bundles to convert')
+    parser.add_argument('--output', help='Output path for a single input (default: the other format alongside)')
+    args = parser.parse_args()
+    if args.output and len(args.inputs) > 1:
+        parser.error('--output needs exactly one input')
+
+    for path in args.inputs:
+        path = path.rstrip('/')
+        if args.output:
+            output = args.output
+        elif os.path.isdir(path):
+            output = os.path.splitext(path)[0] + '.xlsx'
+        else:
+            output = bundle_path(path)
+        save_dataset(load_dataset(path, cache=False), output)
+        print(path, '->', output)
+
+
+if __name__ == '__main__':
+    main()
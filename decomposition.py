@@ -0,0 +1,157 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import time
+
+from backends import get_backend
+from distances import PAIR_ROLES
+from presolve import solve_presolved
+from solver_config import SolverConfig, relative_gap
+from warm_start import greedy_assignment
+
+# Status of a merged result is the weakest status of its parts
+STATUS_ORDER = ['OPTIMAL', 'FEASIBLE']
+
+
+# Connected components of the compatibility graph. Nodes are (role, index); only participants
+# with at least one candidate edge appear, since isolated ones can never be matched.
+# Returns a list of {role: sorted list of original indices}.
+def connected_components(edges):
+    parent = {}
+
+    def find(node):
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    for pair, (provider_role, passenger_role) in PAIR_ROLES.items():
+        for i, j in edges[pair]:
+            a, b = (provider_role, i), (passenger_role, j)
+            parent.setdefault(a, a)
+            parent.setdefault(b, b)
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parent[root_b] = root_a
+
+    groups = {}
+    for node in parent:
+        groups.setdefault(find(node), []).append(node)
+
+    components = []
+    for nodes in groups.values():
+        component = {'driver': [], 'rider': [], 'shifter': []}
+        for role, index in nodes:
+            component[role].append(index)
+        for indices in component.values():
+            indices.sort()
+        components.append(component)
+    return components
+
+
+# Split the instance into one sub-instance per component, re-indexed to local 0..n-1
+# numbering. Every edge is routed to its component in a single pass.
+def component_instances(edges, driver_seats, shifter_seats, components):
+    local = {}
+    for c, component in enumerate(components):
+        for role, indices in component.items():
+            for k, index in enumerate(indices):
+                local[role, index] = (c, k)
+
+    sub_edges = [{pair: [] for pair in PAIR_ROLES} for _ in components]
+    for pair, (provider_role, passenger_role) in PAIR_ROLES.items():
+        for i, j in edges[pair]:
+            c, local_i = local[provider_role, i]
+            local_j = local[passenger_role, j][1]
+            sub_edges[c][pair].append((local_i, local_j))
+
+    return [(sub_edges[c], [driver_seats[i] for i in component['driver']],
+             [shifter_seats[i] for i in component['shifter']], len(component['rider']))
+            for c, component in enumerate(components)]
+
+
+# A component cut off at the deadline before its first solution still has the greedy
+# assignment, which is always feasible, so the merged result keeps every other component's
+# matches and is FEASIBLE rather than UNKNOWN.
+def _solve_batch(backend_name, batch, warm_start, config, deadline, presolve=False):
+    backend = get_backend(backend_name)
+    results = []
+    for instance in batch:
+        hint = greedy_assignment(*instance) if warm_start else None
+        component_config = config.with_deadline(deadline, time.time())
+        if presolve:
+            result = solve_presolved(*instance, backend=backend_name, warm_start=warm_start, config=component_config)
+        else:
+            result = backend.solve_edges(*instance, log_output=False, hint=hint, config=component_config)
+        if result['objective'] is None and result['status'] not in ('INFEASIBLE', 'MODEL_INVALID'):
+            assignment = hint if hint is not None else greedy_assignment(*instance)
+            result.update(status='FEASIBLE', assignment=assignment,
+                          objective=float(sum(len(pairs) for pairs in assignment.values())))
+        results.append(result)
+    return results
+
+
+# Solve every connected component as its own model across a process pool and merge the
+# per-component assignments back into original indices. Components are dealt round-robin
+# (largest first) into a few batches per worker so tiny components don't each pay for IPC.
+# A config time limit is a budget for the whole call: every component solve is cut off at
+# the shared deadline rather than getting the full limit for itself. With presolve, each
+# component is presolved (see presolve.py) before its model is built.
+def solve_decomposed(edges, driver_seats, shifter_seats, n_riders, backend='cpsat', max_workers=None,
+                     warm_start=False, config=None, presolve=False):
+    config = config or SolverConfig()
+    deadline = time.time() + config.time_limit if config.time_limit is not None else None
+    components = connected_components(edges)
+    components.sort(key=lambda c: -sum(len(indices) for indices in c.values()))
+    instances = component_instances(edges, driver_seats, shifter_seats, components)
+
+    max_workers = max_workers or os.cpu_count() or 1
+    n_batches = min(len(instances), max_workers * 4)
+    batches = [instances[k::n_batches] for k in range(n_batches)]
+    order = [components[k::n_batches] for k in range(n_batches)]
+
+    if max_workers == 1 or len(batches) <= 1:
+        batch_results = [_solve_batch(backend, batch, warm_start, config, deadline, presolve) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            n = len(batches)
+            batch_results = list(pool.map(_solve_batch, [backend] * n, batches, [warm_start] * n,
+                                          [config] * n, [deadline] * n, [presolve] * n))
+
+    merged = {
+        'status': 'OPTIMAL',
+        'objective': 0,
+        'bound': 0,
+        'gap': None,
+        'nodes': 0,
+        'assignment': {pair: [] for pair in PAIR_ROLES},
+        'variables': 0,
+        'constraints': 0,
+        'build_time': 0.0,
+        'solve_time': 0.0,
+        'extract_time': 0.0,
+        'components': len(components),
+    }
+    for batch_components, results in zip(order, batch_results):
+        for component, result in zip(batch_components, results):
+            if result['status'] not in STATUS_ORDER:
+                merged['status'] = result['status']
+            elif merged['status'] in STATUS_ORDER:
+                merged['status'] = max(merged['status'], result['status'], key=STATUS_ORDER.index)
+            merged['objective'] += result['objective'] or 0
+            if merged['bound'] is not None and result['bound'] is not None:
+                merged['bound'] += result['bound']
+            else:
+                merged['bound'] = None
+            for key in ('nodes', 'variables', 'constraints', 'build_time', 'solve_time', 'extract_time'):
+                merged[key] += result[key]
+            for pair, (provider_role, passenger_role) in PAIR_ROLES.items():
+                merged['assignment'][pair].extend(
+                    (component[provider_role][i], component[passenger_role][j])
+                    for i, j in result['assignment'][pair])
+
+    merged['gap'] = relative_gap(merged['objective'], merged['bound'])
+    for pairs in merged['assignment'].values():
+        pairs.sort()
+    return merged
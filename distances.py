@@ -0,0 +1,85 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# The four provider -> passenger pairings used by the solvers
+ROLE_PAIRS = ('driver_rider', 'driver_shifter', 'shifter_rider', 'shifter_shifter')
+# Provider and passenger role of each role pair: which participant list each side of an edge
+# indexes into
+PAIR_ROLES = {
+    'driver_rider': ('driver', 'rider'),
+    'shifter_rider': ('shifter', 'rider'),
+    'driver_shifter': ('driver', 'shifter'),
+    'shifter_shifter': ('shifter', 'shifter'),
+}
+
+
+# Function to calculate the distance between coordinates. Works on scalars or on any
+# broadcastable NumPy arrays, so a column against a row gives a full pairwise matrix.
+def haversine(lat1, lon1, lat2, lon2, dtype=np.float64):
+    # Convert coordinates from degrees to radians
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=dtype)) for v in (lat1, lon1, lat2, lon2))
+
+    # Haversine formula
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    return (c * EARTH_RADIUS_KM).astype(dtype, copy=False)
+
+
+# n x m distance matrix between two sets of points
+def pairwise_haversine(lat_a, lon_a, lat_b, lon_b, dtype=np.float64):
+    lat_a = np.asarray(lat_a)[:, None]
+    lon_a = np.asarray(lon_a)[:, None]
+    lat_b = np.asarray(lat_b)[None, :]
+    lon_b = np.asarray(lon_b)[None, :]
+    return haversine(lat_a, lon_a, lat_b, lon_b, dtype=dtype)
+
+
+def _coords(dfs, prefix):
+    lat = np.concatenate([np.asarray(df[prefix + '_lat'], dtype=np.float64) for df in dfs])
+    lon = np.concatenate([np.asarray(df[prefix + '_lon'], dtype=np.float64) for df in dfs])
+    return lat, lon
+
+
+# Distance providers give the n x m matrix between the start (endpoint 'Start') or end
+# (endpoint 'End') points of two lists of sheets, stacked in order. key names the provider
+# and its data in cache keys, and columns are the sheet columns it reads beyond the
+# coordinates. This one is the straight-line distance in km from coordinates;
+# postcode_distances.PostcodeDistanceTable looks distances up by postcode instead.
+class HaversineDistance:
+    key = 'haversine'
+    columns = ()
+
+    def pairwise(self, sources, targets, endpoint, dtype=np.float64):
+        return pairwise_haversine(*_coords(sources, endpoint), *_coords(targets, endpoint), dtype=dtype)
+
+
+HAVERSINE = HaversineDistance()
+
+
+# Start and end distance matrices for every role pairing. Providers (drivers then shifters)
+# are broadcast against passengers (riders then shifters) once per endpoint and the result
+# is sliced into the four blocks. With a tolerance the blocks are boolean "both ends within
+# tolerance" masks instead, which is all the model builders need and far smaller in memory.
+# distance is the distance provider, haversine by default.
+def role_distance_matrices(drivers_df, riders_df, shifters_df, dtype=np.float64, tolerance=None, distance=None):
+    distance = distance or HAVERSINE
+    n_drivers = len(drivers_df)
+    n_riders = len(riders_df)
+
+    start = distance.pairwise([drivers_df, shifters_df], [riders_df, shifters_df], 'Start', dtype=dtype)
+    end = distance.pairwise([drivers_df, shifters_df], [riders_df, shifters_df], 'End', dtype=dtype)
+
+    blocks = {
+        'driver_rider': (slice(None, n_drivers), slice(None, n_riders)),
+        'driver_shifter': (slice(None, n_drivers), slice(n_riders, None)),
+        'shifter_rider': (slice(n_drivers, None), slice(None, n_riders)),
+        'shifter_shifter': (slice(n_drivers, None), slice(n_riders, None)),
+    }
+
+    if tolerance is not None:
+        within = (start <= tolerance) & (end <= tolerance)
+        return {pair: within[block] for pair, block in blocks.items()}
+    return {pair: (start[block], end[block]) for pair, block in blocks.items()}
@@ -0,0 +1,130 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from candidate_edges import candidate_distances, threshold_edges
+from distances import HAVERSINE, ROLE_PAIRS
+from instrumentation import Instrumentation
+from preferences import PREFERENCE_COLUMNS
+from time_windows import TIME_WINDOW, flexibility_ns
+
+# On-disk cache of candidate edges. For each dataset (by content) and time window it keeps the
+# distances of every candidate pair, from which the edges of any tolerance are one comparison
+# away, and the edge lists of the tolerances already asked for. Entries are compressed .npz
+# files; the least recently used ones are deleted once the directory grows past max_bytes.
+CACHE_DIR = '.edge_cache'
+MAX_BYTES = 512 * 1024 * 1024
+COORDINATE_COLUMNS = ('Start_lat', 'Start_lon', 'End_lat', 'End_lon')
+
+
+# Content hash of everything candidate edges depend on: coordinates, departure times,
+# flexibilities and preferences, in row order, plus any further columns the distance provider
+# reads (e.g. postcodes). Where the frames came from (workbook, CSV, bundle) does not matter.
+def dataset_hash(drivers_df, riders_df, shifters_df, columns=()):
+    digest = hashlib.sha256()
+    for df in (drivers_df, riders_df, shifters_df):
+        digest.update(np.int64(len(df)).tobytes())
+        for column in COORDINATE_COLUMNS:
+            digest.update(np.asarray(df[column], dtype=np.float64).tobytes())
+        digest.update(pd.to_datetime(df['departure_time']).to_numpy(dtype='datetime64[ns]').tobytes())
+        flexibility = flexibility_ns(df)
+        if flexibility.any():  # All-zero hashes like no column, so existing entries stay valid
+            digest.update(flexibility.tobytes())
+        for column in PREFERENCE_COLUMNS + tuple(columns):
+            answers = pd.Series(np.asarray(df[column], dtype=object))
+            digest.update(pd.util.hash_pandas_object(answers, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:32]
+
+
+def _save(path, arrays):
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())  # Parallel runs may store the same entry at once
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _load(path):
+    with np.load(path) as data:
+        arrays = {name: data[name] for name in data.files}
+    os.utime(path)  # Mark as recently used
+    return arrays
+
+
+# Delete the least recently used entries until the cache fits in max_bytes
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.endswith('.npz'):
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+
+
+def _store(path, arrays, cache_dir, max_bytes):
+    if sum(array.nbytes for array in arrays.values()) > max_bytes:
+        return  # Would evict everything else and still not fit
+    try:
+        _save(path, arrays)
+        evict(cache_dir, max_bytes)
+    except OSError:  # Read-only or full disk: carry on without the cache
+        pass
+
+
+# build_candidate_edges with the on-disk cache in front of it. A repeat run with the same data,
+# time window, distance provider and tolerance loads the edge list; a new tolerance
+# re-thresholds the cached distances; only new data, a new time window or another provider
+# computes distances.
+def cached_candidate_edges(drivers_df, riders_df, shifters_df, tolerance, time_window=TIME_WINDOW,
+                           cache_dir=CACHE_DIR, max_bytes=MAX_BYTES, instrument=None, distance=None):
+    instrument = instrument or Instrumentation()
+    distance = distance or HAVERSINE
+    with instrument.phase('cache_lookup'):
+        key = '%s-%d' % (dataset_hash(drivers_df, riders_df, shifters_df, distance.columns),
+                         pd.Timedelta(time_window).value)
+        if distance.key != HAVERSINE.key:  # Haversine keeps the keys entries were stored under before
+            key += '-' + distance.key
+        edges_path = os.path.join(cache_dir, '%s-tol%r.edges.npz' % (key, float(tolerance)))
+        distances_path = os.path.join(cache_dir, key + '.distances.npz')
+        os.makedirs(cache_dir, exist_ok=True)
+
+    if os.path.exists(edges_path):
+        with instrument.phase('cache_load'):
+            arrays = _load(edges_path)
+            edges = {pair: list(zip(arrays[pair + '.rows'].tolist(), arrays[pair + '.cols'].tolist()))
+                     for pair in ROLE_PAIRS}
+        instrument.emit('cache', hit='edges', tolerance=tolerance)
+        return edges
+
+    if os.path.exists(distances_path):
+        with instrument.phase('cache_load'):
+            arrays = _load(distances_path)
+            candidates = {pair: (arrays[pair + '.rows'], arrays[pair + '.cols'], arrays[pair + '.distance'])
+                          for pair in ROLE_PAIRS}
+        instrument.emit('cache', hit='distances', tolerance=tolerance)
+    else:
+        candidates = candidate_distances(drivers_df, riders_df, shifters_df, time_window, instrument, distance)
+        instrument.emit('cache', hit=None, tolerance=tolerance)
+        arrays = {}
+        for pair, (rows, cols, distance) in candidates.items():
+            arrays[pair + '.rows'] = rows.astype(np.int32)
+            arrays[pair + '.cols'] = cols.astype(np.int32)
+            arrays[pair + '.distance'] = distance
+        _store(distances_path, arrays, cache_dir, max_bytes)
+
+    with instrument.phase('edge_filter'):
+        edges = threshold_edges(candidates, tolerance)
+    arrays = {}
+    for pair, pairs in edges.items():
+        pair_array = np.array(pairs, dtype=np.int32).reshape(-1, 2)
+        arrays[pair + '.rows'] = pair_array[:, 0]
+        arrays[pair + '.cols'] = pair_array[:, 1]
+    _store(edges_path, arrays, cache_dir, max_bytes)
+    return edges
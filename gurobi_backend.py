@@ -0,0 +1,393 @@
+from collections import Counter
+import os
+
+import gurobipy as gp
+from gurobipy import GRB
+import time
+
+from candidate_edges import edges_by_node
+from instrumentation import Instrumentation, record_edge_variables
+from solver_config import SolverConfig, relative_gap
+from warm_start import active_shifters
+
+STATUS_NAMES = {
+    GRB.OPTIMAL: 'OPTIMAL',
+    GRB.INFEASIBLE: 'INFEASIBLE',
+    GRB.TIME_LIMIT: 'TIME_LIMIT',
+    GRB.WORK_LIMIT: 'WORK_LIMIT',
+    GRB.INTERRUPTED: 'INTERRUPTED',
+}
+
+_ENV = None
+_ENV_PID = None
+
+
+# One Gurobi environment (and licence checkout) per process, shared by every model. A worker
+# forked from a process that already has one starts its own.
+def _env():
+    global _ENV, _ENV_PID
+    if _ENV is None or _ENV_PID != os.getpid():
+        env = gp.Env(empty=True)
+        env.setParam('OutputFlag', 0)
+        env.start()
+        _ENV, _ENV_PID = env, os.getpid()
+    return _ENV
+
+
+def _new_model(log_output):
+    model = gp.Model('ridesharing', env=_env())
+    model.Params.OutputFlag = int(log_output)
+    return model
+
+
+# Constraint emission: builds the Gurobi model from precomputed candidate edges.
+# driver_seats / shifter_seats give the capacity of every driver and shifter.
+# rider_counts optionally gives how many identical riders each rider index stands for (see
+# presolve.py); their edge variables are then integers in 0..count. instrument (an
+# Instrumentation) receives variable counts and the time and size of each constraint family.
+# formulation='strong' builds the same model with a tighter LP relaxation: every y[i][j] is
+# linked to z[i] on its own, a driving shifter's ride-once row is folded into its role row, and
+# the w capacity/once rows implied by the w role row are left out.
+def build_model(edges, driver_seats, shifter_seats, n_riders, log_output=True, instrument=None, rider_counts=None,
+                formulation='standard'):
+    instrument = instrument or Instrumentation()
+    # Create the model
+    model = _new_model(log_output)
+
+    n_drivers = len(driver_seats)
+    n_shifters = len(shifter_seats)
+    rider_counts = rider_counts or [1] * n_riders
+    # Shifters with no candidate rider can never act as drivers, so they get no z
+    drivable = sorted({i for i, _ in edges['shifter_rider']})
+    strong = formulation == 'strong'
+
+    def rider_var(name, j):
+        if rider_counts[j] == 1:
+            return model.addVar(vtype=GRB.BINARY, name=name)
+        return model.addVar(vtype=GRB.INTEGER, ub=rider_counts[j], name=name)
+
+    # Define decision variables
+    with instrument.phase('variables'):
+        x = {(i, j): rider_var('x[%i][%i]' % (i, j), j) for i, j in edges['driver_rider']} #Driver and Rider assignment
+        y = {(i, j): rider_var('y[%i][%i]' % (i, j), j) for i, j in edges['shifter_rider']} #Shifter and Rider assignment
+        z = {i: model.addVar(vtype=GRB.BINARY, name='z[%i]' % i) for i in drivable} #Check if the Shifter is active/assigned
+        x_rider = {(i, j): model.addVar(vtype=GRB.BINARY, name='x_rider[%i][%i]' % (i, j))
+                   for i, j in edges['driver_shifter']} #Driver and Shifter ( acting as rider) assignment.
+        w = {(i, j): model.addVar(vtype=GRB.BINARY, name='w[%i][%i]' % (i, j))
+             for i, j in edges['shifter_shifter']}  # shifter (acting driver) i has been assigned to shifter (acting rider) j
+    record_edge_variables(instrument, edges, n_drivers, n_shifters, n_riders)
+
+    x_by_driver = edges_by_node(x, n_drivers, 0)
+    x_by_rider = edges_by_node(x, n_riders, 1)
+    y_by_shifter = edges_by_node(y, n_shifters, 0)
+    y_by_rider = edges_by_node(y, n_riders, 1)
+    x_rider_by_driver = edges_by_node(x_rider, n_drivers, 0)
+    x_rider_by_shifter = edges_by_node(x_rider, n_shifters, 1)
+    w_by_driver = edges_by_node(w, n_shifters, 0)
+    w_by_rider = edges_by_node(w, n_shifters, 1)
+
+    # Constraints
+    # Each rider is taken by at most one driver or shifter acting as a driver
+    with instrument.constraint_family('rider_once', n_riders) as emitted:
+        for j in range(n_riders):
+            if x_by_rider[j] or y_by_rider[j]:
+                model.addConstr(gp.quicksum(x[e] for e in x_by_rider[j]) +
+                                gp.quicksum(y[e] for e in y_by_rider[j]) <= rider_counts[j])
+                emitted()
+
+    # Each shifter, when acting as a rider, is taken by at most one driver
+    with instrument.constraint_family('shifter_ride_once', n_shifters) as emitted:
+        for j in range(n_shifters):
+            if x_rider_by_shifter[j] and not (strong and j in z):
+                model.addConstr(gp.quicksum(x_rider[e] for e in x_rider_by_shifter[j]) <= 1)
+                emitted()
+
+    # Each driver takes riders up to their capacity
+    with instrument.constraint_family('driver_capacity', n_drivers) as emitted:
+        for i in range(n_drivers):
+            if x_by_driver[i] or x_rider_by_driver[i]:
+                model.addConstr(gp.quicksum(x[e] for e in x_by_driver[i]) +
+                                gp.quicksum(x_rider[e] for e in x_rider_by_driver[i]) <= int(driver_seats[i]))
+                emitted()
+
+    # Each shifter, when acting as a driver, takes riders up to their capacity
+    with instrument.constraint_family('shifter_capacity', n_shifters) as emitted:
+        for i in drivable:
+            model.addConstr(gp.quicksum(y[e] for e in y_by_shifter[i]) <= int(shifter_seats[i]) * z[i])
+            emitted()
+
+    # Strong formulation: a shifter takes a rider only when acting as a driver
+    if strong:
+        with instrument.constraint_family('shifter_link', len(y)) as emitted:
+            for (i, j), var in y.items():
+                model.addConstr(var <= min(rider_counts[j], int(shifter_seats[i])) * z[i])
+                emitted()
+
+    # A shifter cannot act as both a driver and a rider at the same time
+    with instrument.constraint_family('shifter_role', n_shifters) as emitted:
+        for i in drivable:
+            model.addConstr(z[i] + gp.quicksum(x_rider[e] for e in x_rider_by_shifter[i]) <= 1)
+            emitted()
+
+    # Each shifter-driver can take shifter-riders up to their capacity
+    with instrument.constraint_family('shifter_pair_capacity', n_shifters) as emitted:
+        for i in range(n_shifters):
+            if w_by_driver[i] and (not strong or int(shifter_seats[i]) < 1):
+                model.addConstr(gp.quicksum(w[e] for e in w_by_driver[i]) <= int(shifter_seats[i]))
+                emitted()
+
+    # Each shifter-rider is taken by at most one shifter-driver
+    with instrument.constraint_family('shifter_pair_once', n_shifters) as emitted:
+        for j in range(n_shifters):
+            if w_by_rider[j] and not strong:
+                model.addConstr(gp.quicksum(w[e] for e in w_by_rider[j]) <= 1)
+                emitted()
+
+    # A shifter cannot act as both a driver and a rider at the same time
+    with instrument.constraint_family('shifter_pair_role', n_shifters) as emitted:
+        for i in range(n_shifters):
+            if w_by_driver[i] or w_by_rider[i]:
+                model.addConstr(gp.quicksum(w[e] for e in w_by_driver[i]) +
+                                gp.quicksum(w[e] for e in w_by_rider[i]) <= 1)
+                emitted()
+
+    #objective
+    model.setObjective(gp.quicksum(x.values()) + gp.quicksum(y.values()) +
+                       gp.quicksum(w.values()) + gp.quicksum(x_rider.values()), GRB.MAXIMIZE)
+
+    variables = {'driver_rider': x, 'shifter_rider': y, 'driver_shifter': x_rider, 'shifter_shifter': w}
+    return model, variables, z
+
+
+# Use a known assignment (e.g. from warm_start.greedy_assignment) as the MIP start. An edge
+# listed k times starts at k.
+def add_hint(model, variables, z, hint):
+    for pair, pair_vars in variables.items():
+        chosen = Counter(hint[pair])
+        for edge, var in pair_vars.items():
+            var.Start = chosen[edge]
+    active = set(active_shifters(hint))
+    for i, var in z.items():
+        var.Start = int(i in active)
+
+
+# Translate a SolverConfig into Gurobi parameters. Gurobi's search is deterministic already,
+# so deterministic mode only pins the seed.
+def apply_config(model, config):
+    if config.threads is not None:
+        model.Params.Threads = config.threads
+    if config.relative_gap is not None:
+        model.Params.MIPGap = config.relative_gap
+    if config.time_limit is not None:
+        model.Params.TimeLimit = config.time_limit
+    if config.work_limit is not None:
+        model.Params.WorkLimit = config.work_limit
+    if config.deterministic:
+        model.Params.Seed = config.seed
+
+
+# Status, objective, bound, gap and chosen edges of a solved model, in the result format
+# shared by every backend. The solver statistics and extraction time go to instrument.
+def extract_result(model, variables, build_time, solve_time, instrument=None):
+    instrument = instrument or Instrumentation()
+    # MIPGap only exists for models with integer variables, which an instance without edges lacks
+    instrument.record_solver(NodeCount=model.NodeCount, Runtime=model.Runtime,
+                             MIPGap=model.MIPGap if model.SolCount > 0 and model.IsMIP else None,
+                             IterCount=model.IterCount)
+    start_time_extract = time.time()
+    result = {
+        'status': STATUS_NAMES.get(model.status, str(model.status)),
+        'objective': None,
+        'bound': None,
+        'gap': None,
+        'nodes': int(model.NodeCount),
+        'assignment': {pair: [] for pair in variables},
+        'variables': model.NumVars,
+        'constraints': model.NumConstrs,
+        'build_time': build_time,
+        'solve_time': solve_time,
+    }
+    if model.SolCount > 0:
+        if model.status != GRB.OPTIMAL:
+            result['status'] = 'FEASIBLE'
+        result['objective'] = model.objVal
+        result['bound'] = model.ObjBound
+        result['gap'] = relative_gap(result['objective'], result['bound'])
+        if result['status'] == 'OPTIMAL' and result['gap'] > 1e-9:
+            result['status'] = 'FEASIBLE'
+        # One bulk read per role pair over the created edge variables only
+        for pair, pair_vars in variables.items():
+            values = model.getAttr('X', list(pair_vars.values())) if pair_vars else []
+            result['assignment'][pair] = [edge for edge, value in zip(pair_vars, values) for _ in range(round(value))]
+    result['extract_time'] = time.time() - start_time_extract
+    instrument.record_phase('extract', result['extract_time'])
+    return result
+
+
+# Build and solve one instance. The assignment maps each role pair to its chosen (i, j) edges.
+# hint is an optional assignment in the same format used as the starting solution, and fixed
+# an optional set of edges in the same format that must stay in the solution.
+# config (a SolverConfig) sets the time limit, threads, gap, determinism and formulation.
+# instrument (an Instrumentation) receives the phase timings, model counts and search statistics.
+# With rider_counts, an edge appears in the assignment once per rider it carries.
+def solve_edges(edges, driver_seats, shifter_seats, n_riders, log_output=True, hint=None, config=None, fixed=None,
+                instrument=None, rider_counts=None):
+    instrument = instrument or Instrumentation()
+    start_time_build = time.time()
+    config = config or SolverConfig()
+    model, variables, z = build_model(edges, driver_seats, shifter_seats, n_riders, log_output, instrument,
+                                      rider_counts, config.formulation)
+    apply_config(model, config)
+    if hint is not None:
+        add_hint(model, variables, z, hint)
+    if fixed is not None:
+        for pair, pairs in fixed.items():
+            for edge in pairs:
+                variables[pair][edge].LB = 1
+    end_time_build = time.time()
+    instrument.record_phase('build', end_time_build - start_time_build)
+
+    start_time = time.time()
+
+    # Solve the problem
+    model.optimize()
+
+    end_time = time.time()
+    instrument.record_phase('solve', end_time - start_time)
+
+    result = extract_result(model, variables, end_time_build - start_time_build, end_time - start_time, instrument)
+    model.dispose()
+    return result
+
+
+# Solve one instance at several tolerances with a single model. edges are the candidate edges
+# of the largest tolerance and edge_distances[pair][k] the distance of edges[pair][k]. The
+# tolerances are solved smallest first: edges beyond the current tolerance get an upper bound
+# of 0, and every solve starts from the previous solution, which stays feasible as the
+# tolerance grows. Yields (tolerance, result) in that order.
+def solve_tolerances(edges, edge_distances, driver_seats, shifter_seats, n_riders, tolerances, log_output=True,
+                     config=None, instrument=None):
+    instrument = instrument or Instrumentation()
+    start_time_build = time.time()
+    config = config or SolverConfig()
+    model, variables, z = build_model(edges, driver_seats, shifter_seats, n_riders, log_output, instrument,
+                                      formulation=config.formulation)
+    apply_config(model, config)
+    build_time = time.time() - start_time_build
+    instrument.record_phase('build', build_time)
+
+    hint = None
+    try:
+        for tolerance in sorted(tolerances):
+            start_time_build = time.time()
+            for pair, pair_vars in variables.items():
+                for var, distance in zip(pair_vars.values(), edge_distances[pair]):
+                    var.UB = 1 if distance <= tolerance else 0
+            if hint is not None:
+                add_hint(model, variables, z, hint)
+            build_time += time.time() - start_time_build
+
+            start_time = time.time()
+            model.optimize()
+            end_time = time.time()
+            instrument.record_phase('solve', end_time - start_time)
+
+            result = extract_result(model, variables, build_time, end_time - start_time, instrument)
+            build_time = 0.0
+            if result['objective'] is not None:
+                hint = result['assignment']
+            yield tolerance, result
+    finally:
+        model.dispose()
+
+
+# A Gurobi model kept alive between solves and edited in place as participants come and go.
+# Every participant owns its node constraints (the same families as build_model) and every
+# edge variable is added as a column into the constraints of its two endpoints, so an update
+# touches only the affected rows and columns. Node keys are any hashable ids, not 0..n-1.
+# With the strong formulation every shifter/rider edge also gets its own y <= z link row.
+class PersistentModel:
+    def __init__(self, log_output=False, config=None):
+        config = config or SolverConfig()
+        self.model = _new_model(log_output)
+        self.model.ModelSense = GRB.MAXIMIZE
+        apply_config(self.model, config)
+        self.strong = config.formulation == 'strong'
+        self.variables = {'driver_rider': {}, 'shifter_rider': {}, 'driver_shifter': {}, 'shifter_shifter': {}}
+        self.z = {}
+        self.constrs = {}
+        self.links = {}
+
+    def add_driver(self, i, seats):
+        # Each driver takes riders up to their capacity
+        self.constrs['driver', i] = [self.model.addConstr(gp.LinExpr() <= int(seats))]
+
+    def add_rider(self, j):
+        # Each rider is taken by at most one driver or shifter acting as a driver
+        self.constrs['rider', j] = [self.model.addConstr(gp.LinExpr() <= 1)]
+
+    def add_shifter(self, i, seats):
+        z = self.z[i] = self.model.addVar(vtype=GRB.BINARY, name='z[%s]' % (i,))
+        self.constrs['shifter', i] = [
+            self.model.addConstr(-int(seats) * z <= 0),  # Riders up to capacity, only when acting as a driver
+            self.model.addConstr(z + gp.LinExpr() <= 1),  # Not a driver while riding with a driver
+            self.model.addConstr(gp.LinExpr() <= 1),  # Taken by at most one driver
+            self.model.addConstr(gp.LinExpr() <= int(seats)),  # Shifter-riders up to capacity
+            self.model.addConstr(gp.LinExpr() <= 1),  # Taken by at most one shifter-driver
+            self.model.addConstr(gp.LinExpr() <= 1),  # Not both shifter-driver and shifter-rider
+        ]
+
+    def remove_node(self, role, key):
+        self.model.remove(self.constrs.pop((role, key)))
+        if role == 'shifter':
+            self.model.remove(self.z.pop(key))
+
+    # Rows an edge variable appears in, by role pair
+    def _column(self, pair, i, j):
+        if pair == 'driver_rider':
+            return [self.constrs['driver', i][0], self.constrs['rider', j][0]]
+        if pair == 'shifter_rider':
+            return [self.constrs['shifter', i][0], self.constrs['rider', j][0]]
+        if pair == 'driver_shifter':
+            return [self.constrs['driver', i][0], self.constrs['shifter', j][1], self.constrs['shifter', j][2]]
+        return [self.constrs['shifter', i][3], self.constrs['shifter', j][4], self.constrs['shifter', i][5],
+                self.constrs['shifter', j][5]]
+
+    def add_edge(self, pair, i, j):
+        rows = self._column(pair, i, j)
+        var = self.variables[pair][i, j] = self.model.addVar(vtype=GRB.BINARY, obj=1,
+                                                             name='%s[%s][%s]' % (pair, i, j),
+                                                             column=gp.Column([1] * len(rows), rows))
+        if self.strong and pair == 'shifter_rider':
+            self.links[i, j] = self.model.addConstr(var <= self.z[i])
+
+    def remove_edge(self, pair, i, j):
+        self.model.remove(self.variables[pair].pop((i, j)))
+        if (i, j) in self.links and pair == 'shifter_rider':
+            self.model.remove(self.links.pop((i, j)))
+
+    # Previous assignment as the MIP start; edges added since start at 0
+    def set_start(self, assignment):
+        for pair, pair_vars in self.variables.items():
+            chosen = set(assignment[pair])
+            for edge, var in pair_vars.items():
+                var.Start = 1 if edge in chosen else 0
+        active = {i for i, _ in assignment['shifter_rider']}
+        for i, var in self.z.items():
+            var.Start = int(i in active)
+
+    # Committed edges keep a lower bound of 1 for every later solve
+    def lock(self, pair, i, j):
+        self.variables[pair][i, j].LB = 1
+
+    def solve(self, instrument=None):
+        start_time = time.time()
+        self.model.optimize()
+        solve_time = time.time() - start_time
+        if instrument is not None:
+            instrument.record_phase('solve', solve_time)
+        return extract_result(self.model, self.variables, 0.0, solve_time, instrument)
+
+    # Free the model; the session is unusable afterwards
+    def close(self):
+        self.model.dispose()
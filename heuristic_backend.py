@@ -0,0 +1,200 @@
+import time
+
+from presolve import contract_rider_counts, expand_rider_assignment, expand_rider_counts
+from warm_start import BMatching
+
+# Passes of the shifter role-swap local search before giving up on further improvement
+MAX_PASSES = 3
+
+
+# Seat riders and shifters with drivers/shifters in one b-matching. Passengers are the riders
+# followed by the shifters (as riders); providers are the drivers followed by the shifters (as
+# drivers). A shifter's provider capacity is zeroed while it rides, and it may only ride while
+# nobody rides with it, which keeps the z / y_rider exclusivity of the exact models.
+def _match_passengers(edges, driver_seats, shifter_seats, n_riders, hint, max_passes):
+    n_drivers = len(driver_seats)
+    n_shifters = len(shifter_seats)
+
+    options = [[] for _ in range(n_riders + n_shifters)]
+    for i, j in edges['driver_rider']:
+        options[j].append(i)
+    for i, j in edges['shifter_rider']:
+        options[j].append(n_drivers + i)
+    for i, j in edges['driver_shifter']:
+        options[n_riders + j].append(i)
+    seats = [int(s) for s in driver_seats] + [int(s) for s in shifter_seats]
+    matching = BMatching(options, list(seats), journal=True)
+
+    if hint is not None:
+        for i, j in hint['driver_rider']:
+            matching.seat(j, i)
+        for i, j in hint['shifter_rider']:
+            matching.seat(j, n_drivers + i)
+        for i, j in hint['driver_shifter']:
+            matching.capacity[n_drivers + j] = 0
+            matching.seat(n_riders + j, i)
+
+    # Riders first, most constrained first: this is a plain maximum b-matching
+    for rider in sorted(range(n_riders), key=lambda r: len(options[r])):
+        if options[rider] and matching.provider_of[rider] == -1:
+            matching.augment(rider)
+
+    # Then idle shifters ride with drivers that still have seats (or can be freed up)
+    def seat_shifter(shifter):
+        provider = n_drivers + shifter
+        matching.capacity[provider] = 0
+        if matching.augment(n_riders + shifter):
+            return True
+        matching.capacity[provider] = seats[provider]
+        return False
+
+    for shifter in sorted(range(n_shifters), key=lambda s: len(options[n_riders + s])):
+        passenger = n_riders + shifter
+        if options[passenger] and matching.provider_of[passenger] == -1 and matching.load(n_drivers + shifter) == 0:
+            seat_shifter(shifter)
+
+    # Local search: a driving shifter whose riders can all be re-seated elsewhere is worth one
+    # more match as a rider. Each attempt is rolled back unless it strictly improves.
+    for _ in range(max_passes):
+        improved = False
+        driving = [s for s in range(n_shifters) if matching.load(n_drivers + s) > 0 and options[n_riders + s]]
+        for shifter in sorted(driving, key=lambda s: matching.load(n_drivers + s)):
+            provider = n_drivers + shifter
+            checkpoint = matching.checkpoint()
+            riders = list(matching.passengers_of[provider])
+            matching.capacity[provider] = 0
+            for rider in riders:
+                matching.unseat(rider)
+            if all(matching.augment(rider) for rider in riders) and matching.augment(n_riders + shifter):
+                improved = True
+            else:
+                matching.rollback(checkpoint)
+                matching.capacity[provider] = seats[provider]
+        matching.journal.clear()
+        if not improved:
+            break
+
+    assignment = {'driver_rider': [], 'shifter_rider': [], 'driver_shifter': []}
+    for rider in range(n_riders):
+        provider = matching.provider_of[rider]
+        if provider == -1:
+            continue
+        if provider < n_drivers:
+            assignment['driver_rider'].append((provider, rider))
+        else:
+            assignment['shifter_rider'].append((provider - n_drivers, rider))
+    for shifter in range(n_shifters):
+        provider = matching.provider_of[n_riders + shifter]
+        if provider != -1:
+            assignment['driver_shifter'].append((provider, shifter))
+    return assignment
+
+
+# Shifter/shifter pairs: every shifter is in at most one w pair, so this is a matching on a
+# general graph. Greedy (most constrained first), then length-3 augmentations: a pair (a, b)
+# is replaced by (a, c) and (b, d) or (c, a) and (d, b) when c and d are both free.
+def _match_shifter_pairs(pairs, n_shifters):
+    neighbours = [[] for _ in range(n_shifters)]
+    for i, j in pairs:
+        neighbours[i].append((i, j))
+        neighbours[j].append((i, j))
+    partner = [None] * n_shifters
+
+    def free_edges(node, exclude):
+        return [e for e in neighbours[node] if partner[e[0]] is None and partner[e[1]] is None
+                and exclude not in e]
+
+    for i, j in sorted(pairs, key=lambda e: len(neighbours[e[0]]) + len(neighbours[e[1]])):
+        if partner[i] is None and partner[j] is None:
+            partner[i] = partner[j] = (i, j)
+
+    improved = True
+    while improved:
+        improved = False
+        for pair in {p for p in partner if p is not None}:
+            a, b = pair
+            if partner[a] != pair:
+                continue  # Already replaced earlier in this sweep
+            partner[a] = partner[b] = None
+            options_a = free_edges(a, b)
+            options_b = free_edges(b, a)
+            swap = None
+            for edge_a in options_a:
+                other_a = edge_a[0] if edge_a[1] == a else edge_a[1]
+                for edge_b in options_b:
+                    other_b = edge_b[0] if edge_b[1] == b else edge_b[1]
+                    if other_a != other_b:
+                        swap = (edge_a, edge_b)
+                        break
+                if swap:
+                    break
+            if swap is None:
+                partner[a] = partner[b] = pair
+                continue
+            for edge in swap:
+                partner[edge[0]] = partner[edge[1]] = edge
+            improved = True
+
+    return sorted({p for p in partner if p is not None})
+
+
+# Same interface and result format as the exact backends. There is no model to build, so
+# build_time is zero; the status is always FEASIBLE since optimality is not proven, and no
+# bound is reported. config is accepted for interface compatibility: the engine has no
+# search budget to set and is deterministic already. instrument (an Instrumentation) receives
+# the solve time. Counted riders (rider_counts) are matched one by one.
+def solve_edges(edges, driver_seats, shifter_seats, n_riders, log_output=False, hint=None, config=None,
+                max_passes=MAX_PASSES, instrument=None, rider_counts=None):
+    start_time = time.time()
+    if rider_counts is not None:
+        edges, owner = expand_rider_counts(edges, rider_counts)
+        hint = expand_rider_assignment(hint, rider_counts) if hint is not None else None
+        n_riders = len(owner)
+    assignment = _match_passengers(edges, driver_seats, shifter_seats, n_riders, hint, max_passes)
+    assignment['shifter_shifter'] = _match_shifter_pairs(edges['shifter_shifter'], len(shifter_seats))
+    if rider_counts is not None:
+        assignment = contract_rider_counts(assignment, owner)
+    for pairs in assignment.values():
+        pairs.sort()
+    end_time = time.time()
+    if instrument is not None:
+        instrument.record_phase('solve', end_time - start_time)
+
+    if log_output:
+        print('Heuristic matched', sum(len(pairs) for pairs in assignment.values()), 'pairs in',
+              round(end_time - start_time, 3), 'seconds')
+    return {
+        'status': 'FEASIBLE',
+        'objective': float(sum(len(pairs) for pairs in assignment.values())),
+        'bound': None,
+        'gap': None,
+        'nodes': 0,
+        'assignment': assignment,
+        'variables': 0,
+        'constraints': 0,
+        'build_time': 0.0,
+        'solve_time': end_time - start_time,
+        'extract_time': 0.0,
+    }
+
+
+# Same interface as the exact backends' solve_tolerances. Each tolerance keeps the edges
+# within it and is seeded with the previous matching, so the count never drops as the
+# tolerance grows.
+def solve_tolerances(edges, edge_distances, driver_seats, shifter_seats, n_riders, tolerances, log_output=False,
+                     config=None, instrument=None):
+    hint = None
+    for tolerance in sorted(tolerances):
+        within = {pair: [edge for edge, distance in zip(pairs, edge_distances[pair]) if distance <= tolerance]
+                  for pair, pairs in edges.items()}
+        result = solve_edges(within, driver_seats, shifter_seats, n_riders, log_output, hint, config,
+                             instrument=instrument)
+        hint = result['assignment']
+        yield tolerance, result
+
+
+# Relative gap of a heuristic objective to the exact optimum
+def optimality_gap(objective, exact_objective):
+    if not exact_objective:
+        return 0.0
+    return (exact_objective - objective) / exact_objective
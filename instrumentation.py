@@ -0,0 +1,126 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import cProfile
+import json
+import time
+
+
+class _Counter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, n=1):
+        self.count += n
+
+
+# Collects where a solve spends its time. Edge building and the backends emit into it:
+#   phases               seconds per phase (load, datetime_parsing, distance_matrix,
+#                        preference_masks, edge_filter, build, solve, extract); repeated
+#                        phases add up
+#   constraint_families  constraints emitted, constraints skipped (all their variables fixed
+#                        to zero) and seconds taken by each constraint loop
+#   variables            per variable family, how many were created and how many of the
+#                        original dense model's variables were never created (fixed to zero)
+#   solver               the solver's own statistics
+# Used as a context manager it can also append every event to a JSON-lines log and profile
+# everything inside the block with cProfile:
+#   with Instrumentation(log_path='solve.jsonl', profile_path='solve.prof') as instrument:
+#       solve(tolerance=1, instrument=instrument)
+class Instrumentation:
+    def __init__(self, log_path=None, profile_path=None):
+        self.log_path = log_path
+        self.profile_path = profile_path
+        self.phases = defaultdict(float)
+        self.constraint_families = {}
+        self.variables = {}
+        self.solver = {}
+        self._log = None
+        self._profiler = None
+
+    def __enter__(self):
+        if self.log_path is not None:
+            self._log = open(self.log_path, 'a')
+        if self.profile_path is not None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_path)
+            self._profiler = None
+        self.emit('report', **self.report())
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        return False
+
+    # Append one event to the JSON-lines log, if one is open
+    def emit(self, event, **fields):
+        if self._log is not None:
+            self._log.write(json.dumps(dict(event=event, time=time.time(), **fields), default=str) + '\n')
+
+    @contextmanager
+    def phase(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_phase(name, time.perf_counter() - start_time)
+
+    # A phase timed elsewhere, e.g. loading done before the instrument existed
+    def record_phase(self, name, seconds):
+        self.phases[name] += seconds
+        self.emit('phase', name=name, seconds=seconds)
+
+    # Time one constraint loop; call the yielded counter once per constraint added. dense is the
+    # number of rows the loop would add with every pair as a variable: rows left out because
+    # all their variables are fixed to zero are counted as skipped.
+    @contextmanager
+    def constraint_family(self, name, dense=0):
+        emitted = _Counter()
+        start_time = time.perf_counter()
+        try:
+            yield emitted
+        finally:
+            seconds = time.perf_counter() - start_time
+            skipped = max(dense - emitted.count, 0)
+            family = self.constraint_families.setdefault(name, {'count': 0, 'skipped': 0, 'seconds': 0.0})
+            family['count'] += emitted.count
+            family['skipped'] += skipped
+            family['seconds'] += seconds
+            self.emit('constraints', family=name, count=emitted.count, skipped=skipped, seconds=seconds)
+
+    def record_variables(self, name, created, dense):
+        family = self.variables.setdefault(name, {'created': 0, 'fixed_to_zero': 0})
+        family['created'] += created
+        family['fixed_to_zero'] += dense - created
+        self.emit('variables', family=name, created=created, fixed_to_zero=dense - created)
+
+    def record_solver(self, **stats):
+        self.solver.update(stats)
+        self.emit('solver', **stats)
+
+    def report(self):
+        return {
+            'phases': dict(self.phases),
+            'constraint_families': {name: dict(family) for name, family in self.constraint_families.items()},
+            'variables': {name: dict(family) for name, family in self.variables.items()},
+            'solver': dict(self.solver),
+        }
+
+
+# Variable counts of the edge-based models: every role pair has a variable only for its
+# candidate edges, against the full provider x passenger grid of the original model, and z
+# only for the shifters with a candidate rider
+def record_edge_variables(instrument, edges, n_drivers, n_shifters, n_riders):
+    dense = {
+        'driver_rider': n_drivers * n_riders,
+        'shifter_rider': n_shifters * n_riders,
+        'driver_shifter': n_drivers * n_shifters,
+        'shifter_shifter': n_shifters * max(n_shifters - 1, 0),
+    }
+    for pair, pairs in edges.items():
+        instrument.record_variables(pair, len(pairs), dense[pair])
+    instrument.record_variables('shifter_active', len({i for i, _ in edges['shifter_rider']}), n_shifters)
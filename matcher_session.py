@@ -0,0 +1,271 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from backends import get_backend
+from distances import PAIR_ROLES, haversine
+from participants import Participants
+from preferences import rider_preferences_match, shifter_preferences_match
+from solver_config import SolverConfig
+from time_windows import TIME_WINDOW
+
+ROLES = ('driver', 'rider', 'shifter')
+
+# The preference rule between a provider and each kind of passenger
+PREFERENCES_MATCH = {'rider': rider_preferences_match, 'shifter': shifter_preferences_match}
+
+
+# Participants of one role in a growable participants.Participants store, plus an active flag
+# and the session key of every slot. A removed participant's slot goes on a free list and is
+# reused by the next arrival (its edges are gone by then), so the store holds at most the peak
+# number of live participants. Live slots are also indexed by departure-time bucket, one
+# window wide, so near() only looks at the participants of the three buckets around a time.
+class _Participants(Participants):
+    ARRAYS = Participants.ARRAYS + ('active',)
+
+    def __init__(self, window_ns):
+        super().__init__()
+        self.active = np.zeros(0, dtype=bool)
+        self.keys = []
+        self.free = []
+        self.window_ns = window_ns
+        self.width = max(window_ns, 1)
+        self.buckets = {}  # departure time // width -> set of live slots
+
+    def append(self, record, key):
+        if self.free:
+            slot = self.free.pop()
+            self._write(slot, record)
+            self.keys[slot] = key
+        else:
+            slot = super().append(record)
+            self.keys.append(key)
+        self.active[slot] = True
+        self.buckets.setdefault(int(self.times[slot]) // self.width, set()).add(slot)
+        return slot
+
+    def remove(self, slot):
+        bucket = int(self.times[slot]) // self.width
+        self.buckets[bucket].discard(slot)
+        if not self.buckets[bucket]:
+            del self.buckets[bucket]
+        self.active[slot] = False
+        self.keys[slot] = None
+        self.free.append(slot)
+
+    # Live slots departing before time_ns
+    def departed(self, time_ns):
+        last = int(time_ns) // self.width
+        return sorted(slot for bucket, slots in self.buckets.items() if bucket <= last for slot in slots
+                      if self.times[slot] < time_ns)
+
+    # Live slots departing within the window of time_ns with both ends within tolerance km
+    def near(self, coords, time_ns, tolerance):
+        bucket = int(time_ns) // self.width
+        slots = np.array(sorted(slot for b in (bucket - 1, bucket, bucket + 1) for slot in self.buckets.get(b, ())),
+                         dtype=np.int64)
+        slots = slots[np.abs(self.times[slots] - time_ns) <= self.window_ns]
+        other = self.coords[slots]
+        start = haversine(coords[0], coords[1], other[:, 0], other[:, 1])
+        end = haversine(coords[2], coords[3], other[:, 2], other[:, 3])
+        return slots[(start <= tolerance) & (end <= tolerance)].tolist()
+
+
+# A long-lived matcher. Participants arrive and leave one at a time; each event only computes
+# or drops the edges of that participant (one vectorized scan of the other roles), and
+# resolve() re-optimises. With Gurobi the model itself persists and is edited in place; with
+# CP-SAT it is rebuilt from the maintained edges and hinted with the previous assignment.
+# Committed matches stay in every later solution until one of their participants leaves.
+class MatcherSession:
+    def __init__(self, backend='cpsat', tolerance=1, time_window=TIME_WINDOW, config=None, log_output=False):
+        if backend not in ('cpsat', 'gurobi'):
+            raise ValueError('MatcherSession supports the cpsat and gurobi backends, not %r' % backend)
+        self.backend = backend
+        self.tolerance = tolerance
+        self.window_ns = pd.Timedelta(time_window).value
+        self.config = config or SolverConfig()
+        self.log_output = log_output
+
+        self.participants = {role: _Participants(self.window_ns) for role in ROLES}
+        self.slot_of = {}  # participant key -> (role, slot)
+        self.edges = {pair: set() for pair in PAIR_ROLES}
+        self.incident = {}  # (role, slot) -> set of (pair, edge) touching it
+        self.assignment = {pair: set() for pair in PAIR_ROLES}
+        self.locked = {pair: set() for pair in PAIR_ROLES}
+
+        self.model = None
+        if backend == 'gurobi':
+            from gurobi_backend import PersistentModel
+            self.model = PersistentModel(log_output, self.config)
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    # Add one participant. record is a mapping (dict or DataFrame row) with the dataset columns
+    # and a 'type' of 'driver', 'rider' or 'shifter'. The participant is known by key in
+    # results and in remove_participant/commit; key defaults to the record's id and must be
+    # unique within the session. Returns the number of new edges.
+    def add_participant(self, record, key=None):
+        if not hasattr(record, 'get'):
+            record = dict(record)
+        key = record['id'] if key is None else key
+        role = str(record['type']).lower()
+        if role not in ROLES:
+            raise ValueError('Unknown participant type %r' % record['type'])
+        if key in self.slot_of:
+            raise ValueError('Participant %r is already in the session' % (key,))
+
+        table = self.participants[role]
+        slot = table.append(record, key)
+        self.slot_of[key] = (role, slot)
+        self.incident[role, slot] = set()
+        if self.model is not None:
+            if role == 'driver':
+                self.model.add_driver(slot, int(table.seats[slot]))
+            elif role == 'rider':
+                self.model.add_rider(slot)
+            else:
+                self.model.add_shifter(slot, int(table.seats[slot]))
+
+        coords = table.coords[slot]
+        time_ns = table.times[slot]
+        added = 0
+        for pair, (provider_role, passenger_role) in PAIR_ROLES.items():
+            if role not in (provider_role, passenger_role):
+                continue
+            preferences_match = PREFERENCES_MATCH[passenger_role]
+            # A shifter can be either end of a shifter_shifter edge
+            for as_provider in ((True, False) if provider_role == passenger_role else (role == provider_role,)):
+                other_role = passenger_role if as_provider else provider_role
+                other = self.participants[other_role]
+                for other_slot in other.near(coords, time_ns, self.tolerance):
+                    if other_role == role and other_slot == slot:
+                        continue
+                    edge = (slot, other_slot) if as_provider else (other_slot, slot)
+                    provider, passenger = (table, other) if as_provider else (other, table)
+                    if preferences_match(provider.preferences(edge[0]), passenger.preferences(edge[1])):
+                        self._add_edge(pair, edge)
+                        added += 1
+        return added
+
+    def add_participants(self, df):
+        for record in df.to_dict('records'):
+            self.add_participant(record)
+
+    # Drop a participant (a cancellation) together with its edges, matches and locks
+    def remove_participant(self, key):
+        role, slot = self.slot_of.pop(key)
+        for pair, edge in list(self.incident[role, slot]):
+            self._remove_edge(pair, edge)
+        del self.incident[role, slot]
+        self.participants[role].remove(slot)
+        if self.model is not None:
+            self.model.remove_node(role, slot)
+
+    # Drop everyone departing before the given time, as once they have left they can no longer
+    # be matched. Returns their keys.
+    def expire(self, before):
+        before = pd.Timestamp(before).value
+        keys = [table.keys[slot] for table in self.participants.values() for slot in table.departed(before)]
+        for key in keys:
+            self.remove_participant(key)
+        return keys
+
+    def _add_edge(self, pair, edge):
+        provider_role, passenger_role = PAIR_ROLES[pair]
+        self.edges[pair].add(edge)
+        self.incident[provider_role, edge[0]].add((pair, edge))
+        self.incident[passenger_role, edge[1]].add((pair, edge))
+        if self.model is not None:
+            self.model.add_edge(pair, *edge)
+
+    def _remove_edge(self, pair, edge):
+        provider_role, passenger_role = PAIR_ROLES[pair]
+        self.edges[pair].discard(edge)
+        self.assignment[pair].discard(edge)
+        self.locked[pair].discard(edge)
+        self.incident[provider_role, edge[0]].discard((pair, edge))
+        self.incident[passenger_role, edge[1]].discard((pair, edge))
+        if self.model is not None:
+            self.model.remove_edge(pair, *edge)
+
+    # Lock matches of the current assignment so later solves keep them. matches is a list of
+    # (provider key, passenger key) pairs; by default the whole current assignment is locked.
+    def commit(self, matches=None):
+        if matches is None:
+            chosen = [(pair, edge) for pair, pairs in self.assignment.items() for edge in pairs]
+        else:
+            index = {self._edge_keys(pair, edge): (pair, edge) for pair, pairs in self.assignment.items()
+                     for edge in pairs}
+            missing = [match for match in matches if tuple(match) not in index]
+            if missing:
+                raise ValueError('Not in the current assignment: %s' % missing)
+            chosen = [index[tuple(match)] for match in matches]
+        for pair, edge in chosen:
+            self.locked[pair].add(edge)
+            if self.model is not None:
+                self.model.lock(pair, *edge)
+
+    def _edge_keys(self, pair, edge):
+        provider_role, passenger_role = PAIR_ROLES[pair]
+        return (self.participants[provider_role].keys[edge[0]], self.participants[passenger_role].keys[edge[1]])
+
+    # Re-optimise over the current participants. Returns the usual result dict with the
+    # assignment given as (provider key, passenger key) pairs per role pair.
+    def resolve(self):
+        if self.model is not None:
+            self.model.set_start(self.assignment)
+            result = self.model.solve()
+        else:
+            result = self._solve_rebuilt()
+        if result['objective'] is not None:
+            self.assignment = {pair: set(pairs) for pair, pairs in result['assignment'].items()}
+        result['assignment'] = {pair: sorted(self._edge_keys(pair, edge) for edge in pairs)
+                                for pair, pairs in self.assignment.items()}
+        return result
+
+    # Release the solver model (and with it the Gurobi licence use) once the session is done
+    def close(self):
+        if self.model is not None:
+            self.model.close()
+            self.model = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # CP-SAT has no in-place model edits: compact the live slots to 0..n-1, rebuild, and pass the
+    # previous assignment as the hint and the locked edges as fixed
+    def _solve_rebuilt(self):
+        start_time = time.time()
+        index = {}
+        seats = {}
+        for role, table in self.participants.items():
+            live = np.nonzero(table.active[:table.size])[0].tolist()
+            index[role] = {slot: k for k, slot in enumerate(live)}
+            seats[role] = table.seats[live].tolist()
+
+        def compact(edge_sets):
+            out = {}
+            for pair, pairs in edge_sets.items():
+                provider_role, passenger_role = PAIR_ROLES[pair]
+                out[pair] = [(index[provider_role][i], index[passenger_role][j]) for i, j in pairs]
+            return out
+
+        edges = compact(self.edges)
+        hint = compact(self.assignment)
+        fixed = compact(self.locked)
+        prepare_time = time.time() - start_time
+
+        result = get_backend(self.backend).solve_edges(edges, seats['driver'], seats['shifter'], len(seats['rider']),
+                                                       log_output=self.log_output, hint=hint, config=self.config,
+                                                       fixed=fixed)
+        result['build_time'] += prepare_time
+        slots = {role: list(role_index) for role, role_index in index.items()}
+        for pair, pairs in result['assignment'].items():
+            provider_role, passenger_role = PAIR_ROLES[pair]
+            result['assignment'][pair] = [(slots[provider_role][i], slots[passenger_role][j]) for i, j in pairs]
+        return result
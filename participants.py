@@ -0,0 +1,204 @@
+import numpy as np
+import pandas as pd
+
+from preferences import PREFERENCE_COLUMNS
+from time_windows import FLEXIBILITY_COLUMN, departure_ns
+
+# Preference answers every store starts its code table with. Each store extends its own copy
+# with any other answer it sees, so its codes mean the same wherever it is pickled to.
+ANSWERS = ('NO', 'YES', 'BOTH')
+COORDINATE_COLUMNS = ('Start_lat', 'Start_lon', 'End_lat', 'End_lon')
+ROUTE_COLUMNS = ('route_start', 'route_end')
+COLUMNS = ('id',) + ROUTE_COLUMNS + COORDINATE_COLUMNS + ('departure_time', 'seats') + PREFERENCE_COLUMNS + (
+    FLEXIBILITY_COLUMN,)
+
+
+# Codes of values in answers (a store's code table), extending it with new answers
+def _answer_codes(values, answers):
+    values = pd.Series(values, dtype=object).where(lambda v: v.notna(), None).astype(str)
+    answers.extend(sorted(set(values.unique()) - set(answers)))
+    if len(answers) > np.iinfo(np.int8).max:
+        raise ValueError('More than %d distinct preference answers' % np.iinfo(np.int8).max)
+    return pd.Categorical(values, categories=answers).codes.astype(np.int8)
+
+
+# One sheet of participants as contiguous NumPy arrays, built once and read everywhere instead
+# of per-cell DataFrame access:
+#   ids     fixed-width strings
+#   routes  fixed-width strings (n, 2): route_start, route_end postcodes ('' when not given)
+#   coords  float64 (n, 4): Start_lat, Start_lon, End_lat, End_lon
+#   times   int64 departure times in nanoseconds since the epoch
+#   seats   int32 (0 for riders)
+#   prefs   int8 (n, 3): Pet, Smoker, Disable as indexes into the store's answers list
+#   flex    float32 departure flexibility in minutes (see time_windows.py; 0 when not given)
+# Memory is a fixed number of bytes per participant (see row_nbytes). append() grows the arrays by
+# doubling, so a long-running matcher can keep one store per role. Indexing with a column name
+# returns that column as an array, as a DataFrame would, so the edge builders accept either;
+# indexing with a row number returns a Participant record view.
+class Participants:
+    ARRAYS = ('ids', 'routes', 'coords', 'times', 'seats', 'prefs', 'flex')
+
+    def __init__(self, ids=(), coords=None, times=None, seats=None, prefs=None, routes=None, flex=None,
+                 answers=ANSWERS):
+        self.answers = list(answers)
+        self.ids = np.asarray(ids, dtype=str)
+        self.size = len(self.ids)
+        self.routes = np.asarray(routes, dtype=str) if routes is not None else np.zeros((self.size, 2), dtype='<U1')
+        self.coords = np.ascontiguousarray(coords if coords is not None else np.empty((0, 4)), dtype=np.float64)
+        self.times = np.ascontiguousarray(times if times is not None else np.empty(0), dtype=np.int64)
+        self.seats = np.ascontiguousarray(seats if seats is not None else np.zeros(self.size), dtype=np.int32)
+        self.prefs = np.ascontiguousarray(prefs if prefs is not None else np.empty((0, 3)), dtype=np.int8)
+        self.flex = np.ascontiguousarray(flex if flex is not None else np.zeros(self.size), dtype=np.float32)
+
+    # Build from one Driver, Rider or Shifter DataFrame (any index; rows are kept in order)
+    @classmethod
+    def from_frame(cls, df):
+        answers = list(ANSWERS)
+        prefs = np.column_stack([_answer_codes(df[column], answers) for column in PREFERENCE_COLUMNS])
+        seats = df['seats'].fillna(0).to_numpy() if 'seats' in df else None
+        routes = None
+        if all(column in df for column in ROUTE_COLUMNS):
+            routes = np.column_stack([df[column].astype(str).to_numpy(dtype=str) for column in ROUTE_COLUMNS])
+        flex = df[FLEXIBILITY_COLUMN].fillna(0).to_numpy() if FLEXIBILITY_COLUMN in df else None
+        return cls(ids=df['id'].astype(str).to_numpy(dtype=str), routes=routes, flex=flex,
+                   coords=np.column_stack([df[column].to_numpy(dtype=np.float64) for column in COORDINATE_COLUMNS]),
+                   times=departure_ns(df),
+                   seats=seats, prefs=prefs, answers=answers)
+
+    @classmethod
+    def from_frames(cls, drivers_df, riders_df, shifters_df):
+        return cls.from_frame(drivers_df), cls.from_frame(riders_df), cls.from_frame(shifters_df)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.column(key)
+        if key < 0:
+            key += self.size
+        if not 0 <= key < self.size:
+            raise IndexError(key)
+        return Participant(self, key)
+
+    def __iter__(self):
+        return (Participant(self, k) for k in range(self.size))
+
+    def __contains__(self, column):
+        return column in COLUMNS
+
+    # One column by its dataset name
+    def column(self, name):
+        n = self.size
+        if name == 'id':
+            return self.ids[:n]
+        if name == 'departure_time':
+            return self.times[:n].view('datetime64[ns]')
+        if name == 'seats':
+            return self.seats[:n]
+        if name in ROUTE_COLUMNS:
+            return self.routes[:n, ROUTE_COLUMNS.index(name)]
+        if name == FLEXIBILITY_COLUMN:
+            return self.flex[:n]
+        if name in COORDINATE_COLUMNS:
+            return self.coords[:n, COORDINATE_COLUMNS.index(name)]
+        if name in PREFERENCE_COLUMNS:
+            return np.array(self.answers, dtype=object)[self.prefs[:n, PREFERENCE_COLUMNS.index(name)]]
+        raise KeyError(name)
+
+    # (Pet, Smoker, Disable) answers of one participant, as preferences.py compares them
+    def preferences(self, k):
+        return tuple(self.answers[code] for code in self.prefs[k])
+
+    # Bytes held per participant, and in total (including spare capacity)
+    @property
+    def row_nbytes(self):
+        return sum(getattr(self, name).itemsize * int(np.prod(getattr(self, name).shape[1:])) for name in self.ARRAYS)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def _grow(self):
+        for name in self.ARRAYS:
+            array = getattr(self, name)
+            spare = np.zeros((max(len(array), 16),) + array.shape[1:], dtype=array.dtype)
+            setattr(self, name, np.concatenate([array, spare]))
+
+    # Add one participant from a mapping (dict or DataFrame row) with the dataset columns.
+    # Returns its row number.
+    def append(self, record):
+        if self.size == len(self.times):
+            self._grow()
+        k = self.size
+        self._write(k, record)
+        self.size += 1
+        return k
+
+    # Overwrite row k with a record
+    def _write(self, k, record):
+        participant_id = str(record.get('id', ''))
+        if len(participant_id) > self.ids.itemsize // 4:
+            self.ids = self.ids.astype('<U%d' % len(participant_id))
+        self.ids[k] = participant_id
+        routes = [str(record.get(column, '')) for column in ROUTE_COLUMNS]
+        if max(map(len, routes)) > self.routes.itemsize // 4:
+            self.routes = self.routes.astype('<U%d' % max(map(len, routes)))
+        self.routes[k] = routes
+        self.coords[k] = [record[column] for column in COORDINATE_COLUMNS]
+        self.times[k] = pd.Timestamp(record['departure_time']).value
+        seats = record.get('seats')
+        self.seats[k] = int(seats) if seats is not None and pd.notna(seats) else 0
+        self.prefs[k] = _answer_codes([record[column] for column in PREFERENCE_COLUMNS], self.answers)
+        flex = record.get(FLEXIBILITY_COLUMN)
+        self.flex[k] = flex if flex is not None and pd.notna(flex) else 0
+
+    # The given rows (a boolean mask or row numbers) as a new store
+    def take(self, rows):
+        return Participants(answers=self.answers,
+                            **{name: getattr(self, name)[:self.size][rows] for name in Participants.ARRAYS})
+
+    def to_frame(self):
+        return pd.DataFrame({column: self.column(column) for column in COLUMNS})
+
+
+# Read-only view of one row of a Participants store. Holds only the store and the row number,
+# so iterating costs no copies.
+class Participant:
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __getitem__(self, column):
+        if column in PREFERENCE_COLUMNS:
+            return self.store.answers[self.store.prefs[self.index, PREFERENCE_COLUMNS.index(column)]]
+        return self.store.column(column)[self.index]
+
+    def __repr__(self):
+        return 'Participant(%r)' % self.id
+
+    @property
+    def id(self):
+        return str(self.store.ids[self.index])
+
+    @property
+    def start(self):
+        return tuple(self.store.coords[self.index, :2].tolist())
+
+    @property
+    def end(self):
+        return tuple(self.store.coords[self.index, 2:].tolist())
+
+    @property
+    def departure_time(self):
+        return pd.Timestamp(int(self.store.times[self.index]))
+
+    @property
+    def seats(self):
+        return int(self.store.seats[self.index])
+
+    @property
+    def preferences(self):
+        return self.store.preferences(self.index)
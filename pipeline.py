@@ -0,0 +1,190 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import dataclasses
+import itertools
+import json
+import os
+import time
+import warnings
+
+import pandas as pd
+
+from assignment_table import assignment_table, match_counts, write_table
+from backends import BACKENDS, get_backend
+from dataset_io import load_dataset
+from decomposition import solve_decomposed
+from distances import ROLE_PAIRS
+from edge_cache import cached_candidate_edges
+from participants import Participants
+from postcode_distances import METRICS, PostcodeDistanceTable
+from presolve import solve_presolved
+from solver_config import SolverConfig
+from time_windows import TIME_WINDOW
+from warm_start import greedy_assignment
+
+REPORT_FIELDS = ['dataset', 'backend', 'tolerance', 'time_window', 'threads', 'status', 'error', 'objective',
+                 'bound', 'gap'] + list(ROLE_PAIRS) + ['edges', 'load_time', 'precompute_time', 'build_time',
+                                                      'solve_time', 'total_time', 'table']
+
+
+# The solve pipeline of the scripts on data already loaded: candidate edges (through the edge
+# cache), then one model, a decomposed or a presolved solve with the named backend. drivers,
+# riders and shifters are DataFrames or participants.Participants stores. Returns the
+# backend's result with the candidate edge count and precompute time added. With decompose,
+# config.threads is the number of component worker processes, each solving single-threaded;
+# presolve and warm_start then apply to every component.
+# distance is a distance provider (see distances.py), haversine by default; tolerance is in its
+# unit.
+def solve_instance(drivers, riders, shifters, backend='cpsat', tolerance=1, time_window=TIME_WINDOW,
+                   decompose=False, warm_start=False, presolve=False, config=None, log_output=False,
+                   instrument=None, distance=None):
+    config = config or SolverConfig()
+    start_time = time.time()
+    edges = cached_candidate_edges(drivers, riders, shifters, tolerance, time_window, instrument=instrument,
+                                   distance=distance)
+    precompute_time = time.time() - start_time
+
+    driver_seats = list(map(int, drivers['seats']))
+    shifter_seats = list(map(int, shifters['seats']))
+    n_riders = len(riders)
+    if decompose:
+        result = solve_decomposed(edges, driver_seats, shifter_seats, n_riders, backend=backend,
+                                  max_workers=config.threads, warm_start=warm_start,
+                                  config=dataclasses.replace(config, threads=1) if config.threads else config,
+                                  presolve=presolve)
+    elif presolve:
+        result = solve_presolved(edges, driver_seats, shifter_seats, n_riders, backend=backend,
+                                 warm_start=warm_start, config=config, log_output=log_output, instrument=instrument)
+    else:
+        hint = greedy_assignment(edges, driver_seats, shifter_seats, n_riders) if warm_start else None
+        result = get_backend(backend).solve_edges(edges, driver_seats, shifter_seats, n_riders, log_output=log_output,
+                                                  hint=hint, config=config, instrument=instrument)
+    result['edges'] = sum(len(pairs) for pairs in edges.values())
+    result['precompute_time'] = precompute_time
+    return result
+
+
+# Load a dataset (workbook, CSV or bundle) and run solve_instance on it. The result also holds
+# the load time and the matches as an assignment table (see assignment_table.py).
+def solve_dataset(path, backend='cpsat', tolerance=1, time_window=TIME_WINDOW, decompose=False, warm_start=False,
+                  presolve=False, config=None, log_output=False, instrument=None, distance=None):
+    start_time = time.time()
+    drivers, riders, shifters = Participants.from_frames(*load_dataset(path))
+    load_time = time.time() - start_time
+    if instrument is not None:
+        instrument.record_phase('load', load_time)
+    result = solve_instance(drivers, riders, shifters, backend, tolerance, time_window, decompose, warm_start,
+                            presolve, config, log_output, instrument, distance)
+    result['load_time'] = load_time
+    result['table'] = assignment_table(result['assignment'], drivers, riders, shifters)
+    return result
+
+
+def _minutes(time_window):
+    return pd.Timedelta(time_window).total_seconds() / 60
+
+
+# One scenario of a batch, run in a worker process. Writes the match table into tables_dir
+# when given. Errors (a missing licence, a bad file) are reported in the row, not raised.
+# distance_table is the path of a postcode distance table and its metric, opened in the
+# worker, or None for haversine distances.
+def run_scenario(path, backend, tolerance, time_window, config, options, tables_dir=None, distance_table=None):
+    row = dict.fromkeys(REPORT_FIELDS)
+    row.update(dataset=path, backend=backend, tolerance=tolerance, time_window=_minutes(time_window),
+               threads=config.threads)
+    start_time = time.time()
+    try:
+        distance = PostcodeDistanceTable(*distance_table) if distance_table else None
+        result = solve_dataset(path, backend, tolerance, time_window, config=config, distance=distance, **options)
+        for key in ('status', 'objective', 'bound', 'gap', 'edges', 'load_time', 'precompute_time', 'build_time',
+                    'solve_time'):
+            row[key] = result[key]
+        row.update(match_counts(result['table']))
+        if tables_dir is not None:
+            name = '%s-%s-tol%g-win%g.csv' % (os.path.splitext(os.path.basename(path))[0], backend, tolerance,
+                                              row['time_window'])
+            row['table'] = os.path.join(tables_dir, name)
+            write_table(result['table'], row['table'])
+    except Exception as error:
+        row['status'] = 'ERROR'
+        row['error'] = '%s: %s' % (type(error).__name__, error)
+    row['total_time'] = time.time() - start_time
+    return row
+
+
+# Every datasets x backends x tolerances x time windows combination, datasets outermost
+def scenario_grid(datasets, backends=('cpsat',), tolerances=(1,), time_windows=(TIME_WINDOW,)):
+    return list(itertools.product(datasets, backends, tolerances, [pd.Timedelta(w) for w in time_windows]))
+
+
+# Run a scenario grid across jobs worker processes and collect one report row per scenario, in
+# grid order. Each job gets threads solver threads (by default an even share of the cores), so
+# jobs x threads never oversubscribes the machine. config sets everything else (time limit,
+# gap, formulation, ...); options are passed on to solve_dataset (decompose, warm_start,
+# presolve). distance_table is a (path, metric) postcode table for every scenario.
+def run_batch(scenarios, jobs=None, threads=None, config=None, tables_dir=None, distance_table=None, **options):
+    cores = os.cpu_count() or 1
+    jobs = jobs or max(1, min(len(scenarios), cores))
+    threads = threads or max(1, cores // jobs)
+    config = dataclasses.replace(config or SolverConfig(), threads=threads)
+    if tables_dir is not None:
+        os.makedirs(tables_dir, exist_ok=True)
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(run_scenario, path, backend, tolerance, time_window, config, options, tables_dir,
+                               distance_table)
+                   for path, backend, tolerance, time_window in scenarios]
+        for future in futures:
+            row = future.result()
+            rows.append(row)
+            print(row['dataset'], row['backend'], row['tolerance'], row['time_window'], row['status'],
+                  row['objective'], round(row['total_time'], 2), 'seconds', sep='\t', flush=True)
+    return rows
+
+
+def write_report(rows, output):
+    if output.endswith('.json'):
+        with open(output, 'w') as f:
+            json.dump(rows, f, indent=2, default=str)
+    else:
+        with open(output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def main():
+    warnings.filterwarnings('ignore')  # Only for the command line; importers keep their own filters
+    parser = argparse.ArgumentParser(description='Solve every combination of datasets, backends, tolerances and '
+                                                 'time windows across a process pool and write one report.')
+    parser.add_argument('datasets', nargs='+', help='Workbooks, CSV files or bundles')
+    parser.add_argument('--backends', nargs='+', default=['cpsat'], choices=list(BACKENDS))
+    parser.add_argument('--tolerances', nargs='+', type=float, default=[1])
+    parser.add_argument('--time-windows', nargs='+', type=float, default=[_minutes(TIME_WINDOW)],
+                        help='Departure time windows in minutes')
+    parser.add_argument('--jobs', type=int, default=None, help='Scenarios solved at once (default: one per core)')
+    parser.add_argument('--threads', type=int, default=None, help='Solver threads per job (default: cores / jobs)')
+    parser.add_argument('--time-limit', type=float, default=None, help='Per-scenario solve limit in seconds')
+    parser.add_argument('--presolve', action='store_true')
+    parser.add_argument('--warm-start', action='store_true')
+    parser.add_argument('--distance-table', default=None,
+                        help='Postcode distance table (see postcode_distances.py) instead of straight-line distances')
+    parser.add_argument('--metric', default='distance_km', choices=METRICS,
+                        help='With --distance-table, the matrix the tolerances apply to')
+    parser.add_argument('--tables', default=None, help='Directory for one CSV of matches per scenario')
+    parser.add_argument('--output', default='batch_report.csv', help='.csv or .json')
+    args = parser.parse_args()
+
+    scenarios = scenario_grid(args.datasets, args.backends, args.tolerances,
+                              [pd.Timedelta(minutes=minutes) for minutes in args.time_windows])
+    distance_table = (args.distance_table, args.metric) if args.distance_table else None
+    rows = run_batch(scenarios, args.jobs, args.threads, SolverConfig(time_limit=args.time_limit), args.tables,
+                     distance_table, presolve=args.presolve, warm_start=args.warm_start)
+    write_report(rows, args.output)
+    print('Report written to', args.output)
+
+
+if __name__ == '__main__':
+    main()
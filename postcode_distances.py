@@ -0,0 +1,186 @@
+import argparse
+import hashlib
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from dataset_io import load_dataset
+from distances import pairwise_haversine
+
+# Postcode distance tables: one directory per table holding postcodes.npy (the sorted,
+# normalised postcodes, which are the id index) and one square float32 .npy matrix per metric,
+# row = from postcode, column = to postcode. Matrices are memory-mapped, so opening a table
+# costs nothing and a lookup only reads the rows it touches. Pairs without a known distance
+# hold inf and are never within a tolerance.
+TABLE_SUFFIX = '.pcd'
+INDEX_FILE = 'postcodes.npy'
+METRICS = ('distance_km', 'travel_minutes')
+POSTCODE_COLUMNS = {'Start': 'route_start', 'End': 'route_end'}
+POSTCODE_FILES = ('Postcode Datasets/Reading postcode.csv', 'Postcode Datasets/radius.csv')
+ROWS_PER_CHUNK = 1024
+
+
+# Upper case without spaces, the form used in the datasets and the postcode CSVs
+def normalise(postcodes):
+    return np.char.replace(np.char.upper(np.asarray(postcodes, dtype=str)), ' ', '')
+
+
+# A distance provider (see distances.py) backed by a postcode table. Participants are looked
+# up by their route_start / route_end postcodes; metric picks the matrix, and the matching
+# tolerance is in its unit (km or minutes). Every lookup is one vectorized gather.
+class PostcodeDistanceTable:
+    columns = tuple(POSTCODE_COLUMNS.values())
+
+    def __init__(self, path, metric='distance_km'):
+        if metric not in METRICS:
+            raise ValueError('Unknown metric %r, expected one of %s' % (metric, ', '.join(METRICS)))
+        matrix_path = os.path.join(path, metric + '.npy')
+        if not os.path.exists(matrix_path):
+            raise FileNotFoundError('%s has no %s matrix' % (path, metric))
+        self.path = path
+        self.metric = metric
+        self.postcodes = np.load(os.path.join(path, INDEX_FILE))
+        self.matrix = np.load(matrix_path, mmap_mode='r')
+        stat = os.stat(matrix_path)
+        identity = '%s:%d:%d' % (os.path.abspath(matrix_path), stat.st_size, stat.st_mtime_ns)
+        self.key = 'postcode-%s-%s' % (metric, hashlib.sha256(identity.encode()).hexdigest()[:16])
+
+    def __len__(self):
+        return len(self.postcodes)
+
+    # Row/column of every postcode; unknown postcodes raise KeyError
+    def index(self, postcodes):
+        postcodes = normalise(postcodes)
+        rows = np.searchsorted(self.postcodes, postcodes)
+        rows = np.minimum(rows, len(self.postcodes) - 1)
+        unknown = self.postcodes[rows] != postcodes
+        if unknown.any():
+            missing = np.unique(postcodes[unknown])
+            raise KeyError('%d postcode(s) not in %s, e.g. %s' % (len(missing), self.path, ', '.join(missing[:5])))
+        return rows
+
+    def lookup(self, from_postcodes, to_postcodes):
+        return np.asarray(self.matrix[self.index(from_postcodes), self.index(to_postcodes)])
+
+    def pairwise(self, sources, targets, endpoint, dtype=np.float64):
+        column = POSTCODE_COLUMNS[endpoint]
+        rows = self.index(np.concatenate([np.asarray(df[column], dtype=str) for df in sources]))
+        cols = self.index(np.concatenate([np.asarray(df[column], dtype=str) for df in targets]))
+        return np.asarray(self.matrix[rows[:, None], cols[None, :]], dtype=dtype)
+
+
+# Write a table directory, replacing any existing one. matrices maps metric names to square
+# arrays (or a callable filling a memory-mapped output row block by row block, for tables too
+# large to hold in memory) in the order of postcodes.
+def save_table(path, postcodes, **matrices):
+    postcodes = normalise(postcodes)
+    order = np.argsort(postcodes, kind='stable')
+    if len(np.unique(postcodes)) != len(postcodes):
+        raise ValueError('Postcodes must be unique')
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, INDEX_FILE), postcodes[order])
+    for metric, matrix in matrices.items():
+        if metric not in METRICS:
+            raise ValueError('Unknown metric %r, expected one of %s' % (metric, ', '.join(METRICS)))
+        out = np.lib.format.open_memmap(os.path.join(tmp_path, metric + '.npy'), mode='w+', dtype=np.float32,
+                                        shape=(len(postcodes), len(postcodes)))
+        for start in range(0, len(postcodes), ROWS_PER_CHUNK):
+            rows = order[start:start + ROWS_PER_CHUNK]
+            block = matrix(rows) if callable(matrix) else np.asarray(matrix)[rows]
+            out[start:start + len(rows)] = np.asarray(block)[:, order]
+        out.flush()
+        del out
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+# Postcodes and coordinates from the postcode CSVs (Postcode, Latitude, Longitude), first
+# occurrence kept
+def read_postcodes(paths=POSTCODE_FILES):
+    table = pd.concat([pd.read_csv(path, usecols=['Postcode', 'Latitude', 'Longitude']) for path in paths],
+                      ignore_index=True)
+    table['Postcode'] = normalise(table['Postcode'].astype(str).to_numpy())
+    return table.drop_duplicates('Postcode').reset_index(drop=True)
+
+
+# Build a table from a long CSV of precomputed pairs (e.g. exported from a routing engine)
+# with columns origin, destination and distance_km and/or travel_minutes. Pairs are directed;
+# the diagonal is 0 and missing pairs are inf.
+def table_from_pairs(pairs_path, path):
+    pairs = pd.read_csv(pairs_path)
+    pairs['origin'] = normalise(pairs['origin'].astype(str).to_numpy())
+    pairs['destination'] = normalise(pairs['destination'].astype(str).to_numpy())
+    postcodes = np.union1d(pairs['origin'].to_numpy(), pairs['destination'].to_numpy())
+    rows = np.searchsorted(postcodes, pairs['origin'].to_numpy())
+    cols = np.searchsorted(postcodes, pairs['destination'].to_numpy())
+    matrices = {}
+    for metric in METRICS:
+        if metric in pairs:
+            matrix = np.full((len(postcodes), len(postcodes)), np.inf, dtype=np.float32)
+            np.fill_diagonal(matrix, 0)
+            matrix[rows, cols] = pairs[metric].to_numpy(dtype=np.float32)
+            matrices[metric] = matrix
+    if not matrices:
+        raise ValueError('%s has none of the columns %s' % (pairs_path, ', '.join(METRICS)))
+    save_table(path, postcodes, **matrices)
+
+
+# Postcodes and coordinates used by the given datasets, from their route_start/Start_lat/
+# Start_lon and route_end/End_lat/End_lon columns, first occurrence kept
+def dataset_postcodes(paths):
+    frames = []
+    for dataset_path in paths:
+        for df in load_dataset(dataset_path):
+            for endpoint, column in POSTCODE_COLUMNS.items():
+                frames.append(pd.DataFrame({'Postcode': df[column].astype(str).to_numpy(),
+                                            'Latitude': df[endpoint + '_lat'].to_numpy(),
+                                            'Longitude': df[endpoint + '_lon'].to_numpy()}))
+    table = pd.concat(frames, ignore_index=True)
+    table['Postcode'] = normalise(table['Postcode'].to_numpy())
+    return table.drop_duplicates('Postcode').reset_index(drop=True)
+
+
+# Build a table from postcode coordinates (a Postcode/Latitude/Longitude frame, see
+# read_postcodes and dataset_postcodes) when no routed distances are available: the
+# straight-line distance times a detour factor, and travel time at an average speed. The
+# matrix is filled block by block, so its size is bounded by disk rather than memory.
+def table_from_coordinates(path, postcodes, detour=1.0, speed_kmh=None):
+    lat = postcodes['Latitude'].to_numpy(dtype=np.float64)
+    lon = postcodes['Longitude'].to_numpy(dtype=np.float64)
+
+    def distance_km(rows):
+        return pairwise_haversine(lat[rows], lon[rows], lat, lon, dtype=np.float32) * np.float32(detour)
+
+    matrices = {'distance_km': distance_km}
+    if speed_kmh is not None:
+        matrices['travel_minutes'] = lambda rows: distance_km(rows) * np.float32(60 / speed_kmh)
+    save_table(path, postcodes['Postcode'].to_numpy(), **matrices)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a memory-mapped postcode distance table.')
+    parser.add_argument('output', help='Table directory, e.g. Reading' + TABLE_SUFFIX)
+    parser.add_argument('--pairs', default=None, help='CSV of origin, destination, distance_km and/or '
+                                                      'travel_minutes to build the table from')
+    parser.add_argument('--datasets', nargs='+', default=None,
+                        help='Without --pairs, the postcodes (and coordinates) used by these datasets instead of '
+                             'every postcode in the postcode CSVs')
+    parser.add_argument('--detour', type=float, default=1.0, help='Without --pairs, road / straight-line ratio')
+    parser.add_argument('--speed', type=float, default=None, help='Without --pairs, average km/h for travel_minutes')
+    args = parser.parse_args()
+
+    if args.pairs:
+        table_from_pairs(args.pairs, args.output)
+    else:
+        postcodes = dataset_postcodes(args.datasets) if args.datasets else read_postcodes()
+        table_from_coordinates(args.output, postcodes, detour=args.detour, speed_kmh=args.speed)
+    table = PostcodeDistanceTable(args.output)
+    print('Table with', len(table), 'postcodes written to', args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+PREFERENCE_COLUMNS = ('Pet', 'Smoker', 'Disable')
+
+
+# A driver (or shifter acting as a driver) can take a rider unless their Pet/Smoker answers
+# are opposite YES/NO or the rider needs disabled access the driver does not offer.
+# Any other rider answer ('BOTH') is a wildcard.
+def rider_preferences_match(provider, rider):
+    provider_pet, provider_smoker, provider_disable = provider
+    rider_pet, rider_smoker, rider_disable = rider
+    if (provider_pet == 'NO' and rider_pet == 'YES') or (provider_pet == 'YES' and rider_pet == 'NO'):
+        return False
+    if (provider_smoker == 'NO' and rider_smoker == 'YES') or (provider_smoker == 'YES' and rider_smoker == 'NO'):
+        return False
+    if provider_disable == 'NO' and rider_disable == 'YES':
+        return False
+    return True
+
+
+# Shifters riding with a driver or another shifter need identical preferences
+def shifter_preferences_match(provider, rider):
+    return provider == rider
+
+
+# Encode every participant's (Pet, Smoker, Disable) answers as a small integer profile id.
+# Accepts DataFrames or participants.Participants stores.
+# Returns one int array of profile ids per DataFrame, and the answers of each profile. Ids are
+# shared across all the DataFrames passed in, so they index one compatibility table.
+def encode_profiles(*dfs):
+    sizes = [len(df) for df in dfs]
+    profile = np.zeros(sum(sizes), dtype=np.int64)
+    answers = {}
+    for column in PREFERENCE_COLUMNS:
+        answers[column] = np.concatenate([np.asarray(df[column], dtype=object) for df in dfs])
+        codes, uniques = pd.factorize(answers[column], use_na_sentinel=False)
+        profile = profile * len(uniques) + codes
+    _, first, codes = np.unique(profile, return_index=True, return_inverse=True)
+
+    profiles = [tuple(answers[column][k] for column in PREFERENCE_COLUMNS) for k in first]
+    codes = codes.astype(np.int16 if len(profiles) < np.iinfo(np.int16).max else np.int64)
+    bounds = np.cumsum([0] + sizes)
+    return [codes[a:b] for a, b in zip(bounds[:-1], bounds[1:])], profiles
+
+
+# Profile x profile lookup table: table[p, q] says whether profile p may take profile q
+def compatibility_table(profiles, preferences_match):
+    table = np.zeros((len(profiles), len(profiles)), dtype=bool)
+    for p, provider in enumerate(profiles):
+        for q, passenger in enumerate(profiles):
+            table[p, q] = preferences_match(provider, passenger)
+    return table
+
+
+# Boolean preference-compatibility mask for every role pairing, in the same layout as
+# distances.role_distance_matrices: one gather from the lookup table per pairing.
+def role_preference_masks(drivers_df, riders_df, shifters_df):
+    (driver_codes, rider_codes, shifter_codes), profiles = encode_profiles(drivers_df, riders_df, shifters_df)
+    rider_table = compatibility_table(profiles, rider_preferences_match)
+    shifter_table = compatibility_table(profiles, shifter_preferences_match)
+    return {
+        'driver_rider': rider_table[driver_codes[:, None], rider_codes[None, :]],
+        'driver_shifter': shifter_table[driver_codes[:, None], shifter_codes[None, :]],
+        'shifter_rider': rider_table[shifter_codes[:, None], rider_codes[None, :]],
+        'shifter_shifter': shifter_table[shifter_codes[:, None], shifter_codes[None, :]],
+    }
@@ -0,0 +1,209 @@
+from collections import Counter
+
+from backends import get_backend
+from distances import PAIR_ROLES
+from instrumentation import Instrumentation
+from solver_config import relative_gap
+from warm_start import greedy_assignment
+
+
+# Participants with at least one edge, per role, in index order
+def _live(edges):
+    live = {'driver': set(), 'rider': set(), 'shifter': set()}
+    for pair, (provider_role, passenger_role) in PAIR_ROLES.items():
+        for i, j in edges[pair]:
+            live[provider_role].add(i)
+            live[passenger_role].add(j)
+    return {role: sorted(nodes) for role, nodes in live.items()}
+
+
+# Group nodes whose neighbourhoods (a hashable key per node) are identical, in index order
+def _groups(nodes, key):
+    groups = {}
+    for node in nodes:
+        groups.setdefault(key(node), []).append(node)
+    return list(groups.values())
+
+
+# Shrink an instance before the model is built. Every reduction keeps the optimum:
+# 1. providers without seats lose their edges
+# 2. a rider (or a shifter that can never drive) whose only candidate is a driver with room
+#    for all of its candidates rides with that driver in some optimal solution, so the edge
+#    is fixed and the seat taken out of the instance
+# 3. participants left without edges are dropped
+# 4. with collapse=True, riders with the same candidate providers become one rider with a
+#    count, and drivers with the same candidate passengers become one driver with their seats
+#    summed. Shifters are kept apart since their roles interact.
+# Returns the reduced instance (edges, driver_seats, shifter_seats, n_riders, rider_counts),
+# the fixed edges and the map back to original indices that postsolve() uses.
+def presolve(edges, driver_seats, shifter_seats, n_riders, collapse=True, instrument=None):
+    instrument = instrument or Instrumentation()
+    with instrument.phase('presolve'):
+        n_edges = sum(len(edges[pair]) for pair in PAIR_ROLES)
+        driver_seats = [int(seats) for seats in driver_seats]
+        shifter_seats = [int(seats) for seats in shifter_seats]
+        seats = {'driver': driver_seats, 'shifter': shifter_seats}
+        edges = {pair: [(i, j) for i, j in edges[pair] if seats[provider_role][i] > 0]
+                 for pair, (provider_role, _) in PAIR_ROLES.items()}
+
+        rider_degree = Counter(j for pair in ('driver_rider', 'shifter_rider') for _, j in edges[pair])
+        shifter_ride_degree = Counter(j for _, j in edges['driver_shifter'])
+        driver_degree = Counter(i for pair in ('driver_rider', 'driver_shifter') for i, _ in edges[pair])
+        drives = {i for i, _ in edges['shifter_rider']}
+        forced = {pair: [] for pair in PAIR_ROLES}
+        for pair, passenger_degree in (('driver_rider', rider_degree), ('driver_shifter', shifter_ride_degree)):
+            kept = []
+            for i, j in edges[pair]:
+                if (passenger_degree[j] == 1 and driver_degree[i] <= driver_seats[i]
+                        and (pair == 'driver_rider' or j not in drives)):
+                    forced[pair].append((i, j))
+                    driver_seats[i] -= 1
+                else:
+                    kept.append((i, j))
+            edges[pair] = kept
+
+        live = _live(edges)
+        riders_of = {}
+        for pair in ('driver_rider', 'shifter_rider'):
+            for i, j in edges[pair]:
+                riders_of.setdefault(j, set()).add((pair, i))
+        if collapse:
+            rider_groups = _groups(live['rider'], lambda j: frozenset(riders_of[j]))
+        else:
+            rider_groups = [[j] for j in live['rider']]
+        rider_index = {j: k for k, group in enumerate(rider_groups) for j in group}
+        shifter_index = {j: k for k, j in enumerate(live['shifter'])}
+
+        passengers_of = {}
+        for i, j in edges['driver_rider']:
+            passengers_of.setdefault(i, set()).add(('rider', rider_index[j]))
+        for i, j in edges['driver_shifter']:
+            passengers_of.setdefault(i, set()).add(('shifter', j))
+        if collapse:
+            driver_groups = _groups(live['driver'], lambda i: frozenset(passengers_of[i]))
+        else:
+            driver_groups = [[i] for i in live['driver']]
+        driver_index = {i: k for k, group in enumerate(driver_groups) for i in group}
+
+        index = {'driver': driver_index, 'rider': rider_index, 'shifter': shifter_index}
+        reduced_edges = {}
+        for pair, (provider_role, passenger_role) in PAIR_ROLES.items():
+            reduced_edges[pair] = sorted({(index[provider_role][i], index[passenger_role][j])
+                                          for i, j in edges[pair]})
+
+        presolved = {
+            'edges': reduced_edges,
+            'driver_seats': [sum(driver_seats[i] for i in group) for group in driver_groups],
+            'shifter_seats': [shifter_seats[j] for j in live['shifter']],
+            'n_riders': len(rider_groups),
+            'rider_counts': [len(group) for group in rider_groups],
+            'forced': forced,
+            # Postsolve map: original indices behind every reduced driver, rider and shifter
+            'drivers': [[(i, driver_seats[i]) for i in group] for group in driver_groups],
+            'riders': rider_groups,
+            'shifters': live['shifter'],
+        }
+        presolved['stats'] = {
+            'drivers': (len(seats['driver']), len(driver_groups)),
+            'riders': (n_riders, len(rider_groups)),
+            'shifters': (len(shifter_seats), len(live['shifter'])),
+            'edges': (n_edges, sum(len(pairs) for pairs in reduced_edges.values())),
+            'forced': sum(len(pairs) for pairs in forced.values()),
+        }
+    instrument.emit('presolve', **presolved['stats'])
+    return presolved
+
+
+# Map a result of the reduced instance back to original indices and add the fixed edges.
+# Collapsed riders are handed out one per chosen unit of their edge, and a collapsed driver's
+# passengers fill its members' seats in order; both are interchangeable by construction.
+def postsolve(presolved, result):
+    assignment = {pair: list(pairs) for pair, pairs in presolved['forced'].items()}
+    fixed = sum(len(pairs) for pairs in assignment.values())
+    if result['objective'] is None:
+        return dict(result, presolve=presolved['stats'])
+
+    riders = [iter(group) for group in presolved['riders']]
+    drivers = [[[i, seats] for i, seats in group] for group in presolved['drivers']]
+    shifters = presolved['shifters']
+
+    def take_seat(k):
+        for member in drivers[k]:
+            if member[1] > 0:
+                member[1] -= 1
+                return member[0]
+        raise ValueError('Reduced driver %d is assigned more passengers than it has seats' % k)
+
+    for i, j in result['assignment']['driver_rider']:
+        assignment['driver_rider'].append((take_seat(i), next(riders[j])))
+    for i, j in result['assignment']['shifter_rider']:
+        assignment['shifter_rider'].append((shifters[i], next(riders[j])))
+    for i, j in result['assignment']['driver_shifter']:
+        assignment['driver_shifter'].append((take_seat(i), shifters[j]))
+    for i, j in result['assignment']['shifter_shifter']:
+        assignment['shifter_shifter'].append((shifters[i], shifters[j]))
+    for pairs in assignment.values():
+        pairs.sort()
+
+    objective = result['objective'] + fixed
+    bound = result['bound'] + fixed if result['bound'] is not None else None
+    gap = relative_gap(objective, bound) if result['gap'] is not None else None
+    return dict(result, assignment=assignment, objective=objective, bound=bound, gap=gap,
+                presolve=presolved['stats'])
+
+
+# One rider index per counted rider, so engines without counts can run on a collapsed instance.
+# Returns the expanded edges and, for every expanded rider, the collapsed rider it came from.
+def expand_rider_counts(edges, rider_counts):
+    first = []
+    owner = []
+    for j, count in enumerate(rider_counts):
+        first.append(len(owner))
+        owner.extend([j] * count)
+    expanded = dict(edges)
+    for pair in ('driver_rider', 'shifter_rider'):
+        expanded[pair] = [(i, first[j] + k) for i, j in edges[pair] for k in range(rider_counts[j])]
+    return expanded, owner
+
+
+# An assignment of the collapsed instance on the expanded riders: every time an edge is listed
+# it takes the next rider of its count
+def expand_rider_assignment(assignment, rider_counts):
+    first = [0] * len(rider_counts)
+    for j in range(1, len(rider_counts)):
+        first[j] = first[j - 1] + rider_counts[j - 1]
+    used = [0] * len(rider_counts)
+    expanded = dict(assignment)
+    for pair in ('driver_rider', 'shifter_rider'):
+        expanded[pair] = []
+        for i, j in assignment[pair]:
+            expanded[pair].append((i, first[j] + used[j]))
+            used[j] += 1
+    return expanded
+
+
+# Back from expanded riders to collapsed ones; an edge is listed once per rider it carries
+def contract_rider_counts(assignment, owner):
+    contracted = dict(assignment)
+    for pair in ('driver_rider', 'shifter_rider'):
+        contracted[pair] = sorted((i, owner[j]) for i, j in assignment[pair])
+    return contracted
+
+
+# Presolve, solve the reduced instance with the named backend and map the result back.
+# warm_start=True seeds the solver with the greedy assignment of the reduced instance.
+def solve_presolved(edges, driver_seats, shifter_seats, n_riders, backend='cpsat', collapse=True, warm_start=False,
+                    config=None, log_output=False, instrument=None):
+    instrument = instrument or Instrumentation()
+    presolved = presolve(edges, driver_seats, shifter_seats, n_riders, collapse, instrument)
+    hint = None
+    if warm_start:
+        expanded, owner = expand_rider_counts(presolved['edges'], presolved['rider_counts'])
+        hint = contract_rider_counts(greedy_assignment(expanded, presolved['driver_seats'],
+                                                       presolved['shifter_seats'], len(owner)), owner)
+    result = get_backend(backend).solve_edges(presolved['edges'], presolved['driver_seats'],
+                                              presolved['shifter_seats'], presolved['n_riders'],
+                                              log_output=log_output, hint=hint, config=config,
+                                              instrument=instrument, rider_counts=presolved['rider_counts'])
+    with instrument.phase('postsolve'):
+        return postsolve(presolved, result)
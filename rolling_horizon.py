@@ -0,0 +1,267 @@
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import json
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from backends import get_backend
+from candidate_edges import build_candidate_edges
+from dataset_io import load_dataset
+from distances import PAIR_ROLES
+from solver_config import SolverConfig
+from time_windows import TIME_WINDOW
+
+ROLES = ('driver', 'rider', 'shifter')
+WINDOW = pd.Timedelta(minutes=30)
+STEP = pd.Timedelta(minutes=10)
+
+
+# Participant records from a CSV (read in chunks) or JSON-lines file, one dict per row. Every
+# record needs the dataset columns plus 'type' ('driver', 'rider' or 'shifter'), and the file
+# must be in departure_time order.
+def read_participants(path, chunksize=10000):
+    if path.endswith('.jsonl'):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        for chunk in pd.read_csv(path, chunksize=chunksize, parse_dates=['departure_time']):
+            yield from chunk.to_dict('records')
+
+
+# Records of in-memory driver, rider and shifter DataFrames in departure_time order
+def participants_from_frames(drivers_df, riders_df, shifters_df):
+    frames = [df.assign(type=role) for df, role in zip((drivers_df, riders_df, shifters_df), ROLES)]
+    df = pd.concat(frames, ignore_index=True)
+    df['departure_time'] = pd.to_datetime(df['departure_time'])
+    yield from df.sort_values('departure_time', kind='stable').to_dict('records')
+
+
+def _state(record):
+    seats = record.get('seats')
+    seats = int(seats) if pd.notna(seats) else 0
+    return {
+        'id': record['id'],
+        'role': str(record['type']).lower(),
+        'record': record,
+        'time': pd.Timestamp(record['departure_time']).value,
+        'seats': seats,  # Seats still free for riders (and, for drivers, shifters)
+        'leads': seats > 0,  # Shifter can lead a shifter/shifter pair, however many seats riders took
+        'rides': False,  # Shifter already taken by a driver
+        'drives': False,  # Shifter already driving riders
+        'paired': False,  # Shifter already in a shifter/shifter pair
+        'matched': False,  # Rider already taken
+    }
+
+
+def _frame(states):
+    return pd.DataFrame({
+        'Start_lat': [s['record']['Start_lat'] for s in states],
+        'Start_lon': [s['record']['Start_lon'] for s in states],
+        'End_lat': [s['record']['End_lat'] for s in states],
+        'End_lon': [s['record']['End_lon'] for s in states],
+        'departure_time': pd.to_datetime(np.array([s['time'] for s in states], dtype=np.int64)),
+        'seats': [s['seats'] for s in states],
+        'Pet': [s['record']['Pet'] for s in states],
+        'Smoker': [s['record']['Smoker'] for s in states],
+        'Disable': [s['record']['Disable'] for s in states],
+    })
+
+
+# Candidate edges a participant can still take part in, given what it committed to in earlier
+# windows: shifters keep the z / y_rider exclusivity and the single w pair across windows
+def _usable(pair, provider, passenger):
+    if pair == 'driver_rider':
+        return provider['seats'] > 0
+    if pair == 'shifter_rider':
+        return provider['seats'] > 0 and not provider['rides']
+    if pair == 'driver_shifter':
+        return provider['seats'] > 0 and not passenger['rides'] and not passenger['drives']
+    return provider['leads'] and not provider['paired'] and not passenger['paired']
+
+
+# Capacity handed to the backend for a shifter. The backends bound both its riders and its
+# shifter/shifter pair by this one number, so a shifter whose seats riders have used up (its
+# shifter_rider edges are already dropped by _usable) keeps one seat for the pair it can lead.
+def _shifter_seats(state):
+    return 1 if state['leads'] and state['seats'] == 0 else state['seats']
+
+
+def _exhausted(state):
+    if state['role'] == 'rider':
+        return state['matched']
+    if state['role'] == 'driver':
+        return state['seats'] == 0
+    return (state['rides'] or state['seats'] == 0) and (state['rides'] or state['drives']) and state['paired']
+
+
+def _commit(pair, provider, passenger):
+    if pair == 'shifter_shifter':
+        provider['paired'] = passenger['paired'] = True
+        return
+    provider['seats'] -= 1
+    if pair == 'shifter_rider':
+        provider['drives'] = True
+    if passenger['role'] == 'rider':
+        passenger['matched'] = True
+    else:
+        passenger['rides'] = True
+
+
+# Solve one window over the open participants and commit the matches that involve someone
+# departing before the next window starts; the rest are re-optimised in the next window.
+def _solve_window(states, start, horizon, tolerance, time_window, backend, config):
+    by_role = {role: [s for s in states if s['role'] == role] for role in ROLES}
+    edges = build_candidate_edges(_frame(by_role['driver']), _frame(by_role['rider']), _frame(by_role['shifter']),
+                                  tolerance, time_window)
+    for pair, (provider_role, passenger_role) in PAIR_ROLES.items():
+        edges[pair] = [(i, j) for i, j in edges[pair]
+                       if _usable(pair, by_role[provider_role][i], by_role[passenger_role][j])]
+
+    stats = {'start': pd.Timestamp(start), 'participants': len(states),
+             'edges': sum(len(pairs) for pairs in edges.values()), 'status': 'EMPTY', 'objective': 0.0,
+             'committed': 0, 'solve_time': 0.0}
+    matches = []
+    if stats['edges']:
+        result = get_backend(backend).solve_edges(edges, [s['seats'] for s in by_role['driver']],
+                                                  [_shifter_seats(s) for s in by_role['shifter']],
+                                                  len(by_role['rider']), log_output=False, config=config)
+        stats.update(status=result['status'], objective=result['objective'], solve_time=result['solve_time'])
+        for pair, pairs in result['assignment'].items():
+            provider_role, passenger_role = PAIR_ROLES[pair]
+            for i, j in pairs:
+                provider, passenger = by_role[provider_role][i], by_role[passenger_role][j]
+                if min(provider['time'], passenger['time']) < horizon:
+                    _commit(pair, provider, passenger)
+                    matches.append({'pair': pair, 'provider': provider['id'], 'passenger': passenger['id'],
+                                    'window_start': pd.Timestamp(start)})
+    stats['committed'] = len(matches)
+    return matches, stats
+
+
+# Roll the window over time-ordered records, yielding (matches, stats) per window. Only
+# participants departing inside the current window are held in memory. When nobody is open
+# the window jumps straight to the next departure.
+def _roll(records, window, step, tolerance, time_window, backend, config):
+    window, step = pd.Timedelta(window).value, pd.Timedelta(step).value
+    records = iter(records)
+    pending = deque()
+    open_states = []
+    start = None
+    last_time = None
+
+    def pull():
+        nonlocal last_time
+        record = next(records, None)
+        if record is None:
+            return False
+        state = _state(record)
+        if last_time is not None and state['time'] < last_time:
+            raise ValueError('Participants must arrive in departure_time order (%s came after %s)'
+                             % (pd.Timestamp(state['time']), pd.Timestamp(last_time)))
+        last_time = state['time']
+        pending.append(state)
+        return True
+
+    while True:
+        if not open_states:
+            if not pending and not pull():
+                return
+            start = pending[0]['time'] if start is None else max(start, pending[0]['time'])
+        # Bring in everyone departing before the end of this window
+        while True:
+            if not pending and not pull():
+                break
+            if pending[0]['time'] >= start + window:
+                break
+            open_states.append(pending.popleft())
+
+        horizon = start + step
+        matches, stats = _solve_window(open_states, start, horizon, tolerance, time_window, backend, config)
+        yield matches, stats
+
+        # Participants leaving the horizon are final, matched or not
+        open_states = [s for s in open_states if s['time'] >= horizon and not _exhausted(s)]
+        start = horizon
+
+
+def _roll_segment(records, window, step, tolerance, time_window, backend, config):
+    return list(_roll(records, window, step, tolerance, time_window, backend, config))
+
+
+# Split time-ordered records into stretches separated by a quiet gap no window or pair spans
+def _segments(records, gap):
+    segment = []
+    for record in records:
+        if segment and pd.Timestamp(record['departure_time']).value - segment[-1][0] > gap:
+            yield [r for _, r in segment]
+            segment = []
+        segment.append((pd.Timestamp(record['departure_time']).value, record))
+    if segment:
+        yield [r for _, r in segment]
+
+
+# Rolling-horizon matching over time-ordered participant records. Returns the committed
+# matches, one stats row per window and the total match count. With jobs > 1, stretches of
+# the day separated by a gap of at least window + step (and the pairing time window) are
+# independent and solved concurrently, holding at most jobs * 2 stretches in memory; windows
+# chained by carried-over participants always run in order.
+def rolling_horizon(records, window=WINDOW, step=STEP, tolerance=1, time_window=TIME_WINDOW, backend='cpsat',
+                    config=None, jobs=1):
+    config = config or SolverConfig()
+    start_time = time.time()
+    params = (window, step, tolerance, time_window, backend, config)
+    matches, windows = [], []
+
+    def collect(rolled):
+        for window_matches, stats in rolled:
+            matches.extend(window_matches)
+            windows.append(stats)
+
+    if jobs <= 1:
+        collect(_roll(records, *params))
+    else:
+        gap = max(pd.Timedelta(window).value + pd.Timedelta(step).value, pd.Timedelta(time_window).value)
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = deque()
+            for segment in _segments(records, gap):
+                futures.append(pool.submit(_roll_segment, segment, *params))
+                if len(futures) >= jobs * 2:
+                    collect(futures.popleft().result())
+            while futures:
+                collect(futures.popleft().result())
+
+    return {'matches': matches, 'windows': windows, 'match_count': len(matches), 'time': time.time() - start_time}
+
+
+def main():
+    warnings.filterwarnings('ignore')  # Only for the command line; importers keep their own filters
+    parser = argparse.ArgumentParser(description='Match participants window by window over the day.')
+    parser.add_argument('path', help='Workbook or bundle (any order), or a CSV/JSONL stream in departure order')
+    parser.add_argument('--window', type=float, default=30, help='Window length in minutes')
+    parser.add_argument('--step', type=float, default=10, help='Minutes the window moves each time')
+    parser.add_argument('--tolerance', type=float, default=1)
+    parser.add_argument('--backend', default='cpsat')
+    parser.add_argument('--jobs', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.path.endswith(('.csv', '.jsonl')):
+        records = read_participants(args.path)
+    else:
+        records = participants_from_frames(*load_dataset(args.path))
+    result = rolling_horizon(records, pd.Timedelta(minutes=args.window), pd.Timedelta(minutes=args.step),
+                             args.tolerance, backend=args.backend, jobs=args.jobs)
+    for match in result['matches']:
+        print(match['window_start'], match['pair'], match['provider'], match['passenger'], sep='\t')
+    print('Windows:', len(result['windows']))
+    print('Match count:', result['match_count'])
+    print('Total execution time:', round(result['time'], 2), 'seconds')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+from dataclasses import dataclass, replace
+from typing import Optional
+
+# Model formulations the exact backends can build: 'standard' is the original model, 'strong'
+# has the same solutions with a tighter LP relaxation (see the backends' build_model)
+FORMULATIONS = ('standard', 'strong')
+
+
+# Solver budget and search settings shared by every backend. Unset fields keep the solver's
+# own default, so SolverConfig() behaves exactly like passing no config at all. Runs are only
+# reproducible when they are bounded by work_limit: a wall-clock time_limit stops wherever the
+# search happens to be, but it is the one to use for a latency budget.
+@dataclass(frozen=True)
+class SolverConfig:
+    time_limit: Optional[float] = None  # Wall-clock budget in seconds; the best incumbent is returned when it hits
+    work_limit: Optional[float] = None  # Deterministic work budget (CP-SAT deterministic time / Gurobi WorkLimit)
+    threads: Optional[int] = None  # Search workers (CP-SAT) / Threads (Gurobi)
+    relative_gap: Optional[float] = None  # Stop once (bound - objective) / objective is at most this
+    deterministic: bool = False  # Reproducible search: fixed seed and deterministic parallel search
+    seed: int = 0  # Random seed used in deterministic mode
+    formulation: str = 'standard'  # One of FORMULATIONS; the heuristic ignores it
+
+    def __post_init__(self):
+        if self.formulation not in FORMULATIONS:
+            raise ValueError('Unknown formulation %r, expected one of %s' % (self.formulation, ', '.join(FORMULATIONS)))
+
+    # Copy with the time limit cut down to what is left before an absolute deadline
+    def with_deadline(self, deadline, now):
+        if deadline is None:
+            return self
+        return replace(self, time_limit=max(deadline - now, 0.01))
+
+
+# Relative gap between an objective and its proven bound, as reported by both solvers
+def relative_gap(objective, bound):
+    if objective is None or bound is None:
+        return None
+    return abs(bound - objective) / max(1.0, abs(objective))
@@ -0,0 +1,89 @@
+import numpy as np
+
+from distances import haversine
+
+KM_PER_DEGREE = 111.195  # Length of one degree of latitude (6371 km * pi / 180)
+MAX_CANDIDATES = 1 << 22  # Query/point pairs checked at once
+
+
+def _unique_points(lat, lon):
+    points = np.column_stack([np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)])
+    points, inverse = np.unique(points, axis=0, return_inverse=True)
+    return points[:, 0], points[:, 1], inverse.reshape(-1)
+
+
+# Grid-hash index over a set of (lat, lon) points for "is any point within R km" queries.
+# Points are bucketed into cells at least radius_km wide, so every neighbour of a query lies
+# in the query's cell or one of the 8 cells around it. Cell keys are kept sorted and looked
+# up with searchsorted, and only the points in those 9 cells have their distance computed.
+# Participants share postcodes, so points (and queries) are de-duplicated first: a dense cell
+# costs its distinct locations, not its participants.
+class GridIndex:
+    def __init__(self, lat, lon, radius_km):
+        self.radius_km = radius_km
+        self.size = len(lat)
+        self.lat, self.lon, _ = _unique_points(lat, lon)
+
+        # Longitude degrees shrink towards the poles; size cells for the highest latitude indexed
+        max_abs_lat = min(np.abs(self.lat).max(initial=0.0), 89.0)
+        self.lat_step = radius_km / KM_PER_DEGREE * 1.01
+        self.lon_step = radius_km / (KM_PER_DEGREE * np.cos(np.radians(max_abs_lat))) * 1.01
+
+        cell_lat, cell_lon = self._cells(self.lat, self.lon)
+        keys = self._keys(cell_lat, cell_lon)
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def __len__(self):
+        return self.size
+
+    def _cells(self, lat, lon):
+        return np.floor(lat / self.lat_step).astype(np.int64), np.floor(lon / self.lon_step).astype(np.int64)
+
+    @staticmethod
+    def _keys(cell_lat, cell_lon):
+        # Longitude cells never exceed 360 / lon_step, so this packing is collision free
+        return cell_lat * (1 << 32) + cell_lon
+
+    # Boolean mask: True where some indexed point lies within the radius of the query point.
+    # Queries are de-duplicated and processed in chunks, and at most MAX_CANDIDATES distances
+    # are computed at once, so memory stays bounded when cells are dense.
+    def any_within(self, lat, lon, chunk_size=65536):
+        if len(self) == 0 or len(lat) == 0:
+            return np.zeros(len(lat), dtype=bool)
+        lat, lon, inverse = _unique_points(lat, lon)
+        found = np.zeros(len(lat), dtype=bool)
+        for start in range(0, len(lat), chunk_size):
+            stop = min(start + chunk_size, len(lat))
+            self._any_within_chunk(lat[start:stop], lon[start:stop], found[start:stop])
+        return found[inverse]
+
+    # Sets found (a view over the chunk's queries) where a neighbour is found
+    def _any_within_chunk(self, lat, lon, found):
+        cell_lat, cell_lon = self._cells(lat, lon)
+        for d_lat in (-1, 0, 1):
+            for d_lon in (-1, 0, 1):
+                keys = self._keys(cell_lat + d_lat, cell_lon + d_lon)
+                lo = np.searchsorted(self.keys, keys, side='left')
+                hi = np.searchsorted(self.keys, keys, side='right')
+                counts = hi - lo
+                # Only queries still unresolved need their candidates checked
+                counts[found] = 0
+                ends = np.cumsum(counts)
+                start = 0
+                while start < len(lat):
+                    done = ends[start - 1] if start else 0
+                    if done == ends[-1]:
+                        break
+                    stop = max(int(np.searchsorted(ends, done + MAX_CANDIDATES, side='right')), start + 1)
+                    self._check(lat, lon, lo, counts, start, stop, found)
+                    start = stop
+
+    def _check(self, lat, lon, lo, counts, start, stop, found):
+        counts = counts[start:stop]
+        total = counts.sum()
+        query = np.repeat(np.arange(start, stop), counts)
+        run_start = np.repeat(np.cumsum(counts) - counts, counts)
+        candidate = self.order[np.repeat(lo[start:stop], counts) + np.arange(total) - run_start]
+        hit = haversine(lat[query], lon[query], self.lat[candidate], self.lon[candidate]) <= self.radius_km
+        found[query[hit]] = True
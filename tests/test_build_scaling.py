@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+import cpsat_backend
+from candidate_edges import build_candidate_edges
+from dataset_io import load_dataset
+
+
+def _build(backend, path):
+    drivers, riders, shifters = load_dataset(path, cache=False)
+    best = None
+    for _ in range(3):  # Best of three, to keep scheduling noise out of the ratio
+        start_time = time.perf_counter()
+        edges = build_candidate_edges(drivers, riders, shifters, 1)
+        if backend is cpsat_backend:
+            backend.build_model(edges, drivers['seats'].tolist(), shifters['seats'].tolist(), len(riders))
+        else:
+            backend.build_model(edges, drivers['seats'].tolist(), shifters['seats'].tolist(), len(riders),
+                                log_output=False)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return len(drivers) + len(riders) + len(shifters), sum(len(pairs) for pairs in edges.values()), best
+
+
+def _backends():
+    yield cpsat_backend
+    try:
+        import gurobi_backend
+    except ImportError:
+        return
+    yield gurobi_backend
+
+
+# Candidate edges and the model build (precompute plus constraint emission) must not grow
+# faster than quadratically from Filtered(100) to Filtered(800). Recomputing the distance
+# matrices per provider made the build cubic. The small build is floored at 5 ms so timer
+# resolution cannot fail the test.
+@pytest.mark.parametrize('backend', list(_backends()), ids=lambda backend: backend.__name__)
+def test_build_time_scales_at_most_quadratically(backend):
+    small_n, small_edges, small_time = _build(backend, 'Datasets/Filtered(100).xlsx')
+    large_n, large_edges, large_time = _build(backend, 'Datasets/Filtered(800).xlsx')
+    growth = large_n / small_n
+    assert large_edges / small_edges < growth ** 1.5
+    assert large_time < growth ** 2 * max(small_time, 0.005)
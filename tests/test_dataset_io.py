@@ -0,0 +1,23 @@
+import pandas as pd
+
+from Data_preprocesser import stream_filter_and_save
+from dataset_io import load_dataset, read_csv, save_dataset
+
+
+# Role types are matched in any case, in the batch loader as in the streaming filter
+def test_read_csv_accepts_any_case(tmp_path):
+    frames = load_dataset('Datasets/Filtered(100).xlsx', cache=False)
+    lower = tmp_path / 'lower.csv'
+    save_dataset(frames, str(lower))
+    df = pd.read_csv(lower)
+    df['type'] = df['type'].str.capitalize()
+    mixed = tmp_path / 'mixed.csv'
+    df.to_csv(mixed, index=False)
+
+    for expected, got in zip(read_csv(str(lower)), read_csv(str(mixed))):
+        assert len(got) == len(expected) > 0
+        assert got['id'].astype(str).tolist() == expected['id'].astype(str).tolist()
+
+    streamed = tmp_path / 'streamed.csv'
+    counts = stream_filter_and_save(str(mixed), str(streamed), chunksize=50)
+    assert [len(df) for df in read_csv(str(streamed))] == list(counts.values())
@@ -0,0 +1,43 @@
+from collections import Counter
+
+from candidate_edges import build_candidate_edges
+from dataset_io import load_dataset
+from decomposition import solve_decomposed
+from solver_config import SolverConfig
+
+
+def _instance():
+    drivers, riders, shifters = load_dataset('Datasets/Dataset(800).xlsx', cache=False)
+    edges = build_candidate_edges(drivers, riders, shifters, 20)
+    return edges, drivers['seats'].tolist(), shifters['seats'].tolist(), len(riders)
+
+
+# Components cut off at the shared deadline fall back to the greedy assignment instead of
+# turning the whole result UNKNOWN and dropping the matches of the components that finished
+def test_tiny_time_limit_keeps_matches():
+    edges, driver_seats, shifter_seats, n_riders = _instance()
+    result = solve_decomposed(edges, driver_seats, shifter_seats, n_riders, max_workers=1,
+                              config=SolverConfig(time_limit=0.001))
+    assert result['status'] in ('OPTIMAL', 'FEASIBLE')
+    assignment = result['assignment']
+    assert result['objective'] == sum(len(pairs) for pairs in assignment.values()) > 0
+
+    for pair, pairs in assignment.items():
+        assert set(pairs) <= set(edges[pair])
+    riders = Counter(j for pair in ('driver_rider', 'shifter_rider') for _, j in assignment[pair])
+    assert max(riders.values()) == 1
+    load = Counter(i for pair in ('driver_rider', 'driver_shifter') for i, _ in assignment[pair])
+    assert all(load[i] <= driver_seats[i] for i in load)
+    load = Counter(i for i, _ in assignment['shifter_rider'])
+    assert all(load[i] <= shifter_seats[i] for i in load)
+
+
+# presolve=True is applied per component, not dropped: the optimum is unchanged and the models
+# are smaller
+def test_presolve_per_component():
+    edges, driver_seats, shifter_seats, n_riders = _instance()
+    plain = solve_decomposed(edges, driver_seats, shifter_seats, n_riders, max_workers=1)
+    presolved = solve_decomposed(edges, driver_seats, shifter_seats, n_riders, max_workers=1, presolve=True)
+    assert presolved['status'] == plain['status'] == 'OPTIMAL'
+    assert presolved['objective'] == plain['objective']
+    assert presolved['variables'] < plain['variables']
@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip('gurobipy')
+
+import gurobi_backend
+from distances import ROLE_PAIRS
+from presolve import solve_presolved
+
+
+def _no_edges():
+    return {pair: [] for pair in ROLE_PAIRS}
+
+
+# Without edge variables the model has no integer variables and Gurobi defines no MIPGap
+def test_empty_edge_set():
+    result = gurobi_backend.solve_edges(_no_edges(), [2], [1], 1, log_output=False)
+    assert result['status'] == 'OPTIMAL'
+    assert result['objective'] == 0
+    assert result['gap'] == 0
+    assert result['assignment'] == _no_edges()
+
+
+# The rider's only candidate is a driver with room for it, so presolve fixes the match and
+# leaves nothing for the solver
+def test_presolve_removes_everything():
+    edges = _no_edges()
+    edges['driver_rider'] = [(0, 0)]
+    result = solve_presolved(edges, [2], [], 1, backend='gurobi')
+    assert result['status'] == 'OPTIMAL'
+    assert result['objective'] == 1
+    assert result['assignment']['driver_rider'] == [(0, 0)]
+
+
+# Every model shares the process's one environment, so repeated solves do not check out a
+# licence each
+def test_models_share_one_environment():
+    edges = _no_edges()
+    edges['driver_rider'] = [(0, 0)]
+    gurobi_backend.solve_edges(edges, [1], [], 1, log_output=False)
+    env = gurobi_backend._env()
+    for _ in range(20):
+        assert gurobi_backend.solve_edges(edges, [1], [], 1, log_output=False)['objective'] == 1
+    assert gurobi_backend._env() is env
@@ -0,0 +1,53 @@
+import pandas as pd
+
+from matcher_session import MatcherSession
+
+START = pd.Timestamp('2024-01-01 06:00')
+
+
+def _record(key, role, minutes):
+    return {'id': key, 'type': role, 'Start_lat': 51.5, 'Start_lon': -0.1, 'End_lat': 51.6, 'End_lon': -0.2,
+            'departure_time': START + pd.Timedelta(minutes=minutes), 'seats': 0 if role == 'rider' else 2,
+            'Pet': 'NO', 'Smoker': 'NO', 'Disable': 'NO'}
+
+
+def _edge_keys(session):
+    return {pair: sorted(session._edge_keys(pair, edge) for edge in pairs) for pair, pairs in session.edges.items()}
+
+
+# Cancellations free their slots for the next arrivals, so however many participants have come
+# and gone the stores hold only the peak live count and near() only sees live participants in
+# the buckets around a departure time
+def test_cancellations_do_not_accumulate():
+    live = [_record('D%d' % k, 'driver', 10 * k) for k in range(5)] + [
+        _record('R%d' % k, 'rider', 10 * k + 5) for k in range(5)] + [
+        _record('S%d' % k, 'shifter', 10 * k + 3) for k in range(5)]
+    session = MatcherSession()
+    for record in live:
+        session.add_participant(record)
+    for k in range(300):
+        role = ('driver', 'rider', 'shifter')[k % 3]
+        session.add_participant(_record('X%d' % k, role, k % 50))
+        session.remove_participant('X%d' % k)
+
+    for table in session.participants.values():
+        assert table.size <= 6
+        assert sum(len(slots) for slots in table.buckets.values()) == 5
+
+    fresh = MatcherSession()
+    for record in live:
+        fresh.add_participant(record)
+    assert _edge_keys(session) == _edge_keys(fresh)
+    assert session.resolve()['objective'] == fresh.resolve()['objective']
+
+
+# expire() drops everyone who departed before the given time along with their edges
+def test_expire():
+    session = MatcherSession()
+    for minutes in (0, 10, 40, 60):
+        session.add_participant(_record('D%d' % minutes, 'driver', minutes))
+        session.add_participant(_record('R%d' % minutes, 'rider', minutes))
+
+    assert sorted(session.expire(START + pd.Timedelta(minutes=30))) == ['D0', 'D10', 'R0', 'R10']
+    assert sorted(session.slot_of) == ['D40', 'D60', 'R40', 'R60']
+    assert all(key[0][1:] in ('40', '60') for key in _edge_keys(session)['driver_rider'])
@@ -0,0 +1,29 @@
+import pickle
+
+import numpy as np
+
+import participants
+from dataset_io import load_dataset
+from participants import Participants
+from preferences import PREFERENCE_COLUMNS
+
+
+# Each store keeps its own answer codes: encoding unusual answers in one store changes neither
+# the module's table nor any other store, and a pickled store decodes the same elsewhere
+def test_answer_codes_belong_to_the_store():
+    drivers, riders, _ = load_dataset('Datasets/Filtered(100).xlsx', cache=False)
+    odd = drivers.copy()
+    odd['Pet'] = ['Maybe', 'Sometimes'] * (len(odd) // 2) + ['Maybe'] * (len(odd) % 2)
+    odd_store = Participants.from_frame(odd)
+    store = Participants.from_frame(riders)
+
+    assert participants.ANSWERS == ('NO', 'YES', 'BOTH')
+    assert 'Maybe' in odd_store.answers and 'Maybe' not in store.answers
+
+    for original, frame in ((odd_store, odd), (store, riders)):
+        copy = pickle.loads(pickle.dumps(original))
+        for column in PREFERENCE_COLUMNS:
+            expected = frame[column].astype(str).to_numpy()
+            assert np.array_equal(copy[column].astype(str), expected)
+        assert copy.preferences(0) == tuple(str(frame[column].iloc[0]) for column in PREFERENCE_COLUMNS)
+        assert copy.take([1, 0]).preferences(1) == copy.preferences(0)
@@ -0,0 +1,33 @@
+import pandas as pd
+
+import cpsat_backend
+from candidate_edges import build_candidate_edges
+from rolling_horizon import participants_from_frames, rolling_horizon
+
+
+def _frame(ids, minutes, seats):
+    start = pd.Timestamp('2024-01-01 08:00')
+    return pd.DataFrame({
+        'id': ids,
+        'Start_lat': 51.5, 'Start_lon': -0.1, 'End_lat': 51.6, 'End_lon': -0.2,
+        'departure_time': [start + pd.Timedelta(minutes=m) for m in minutes],
+        'seats': seats,
+        'Pet': 'NO', 'Smoker': 'NO', 'Disable': 'NO',
+    })
+
+
+# Everyone departs inside the first window, so rolling must match the whole-day model. The
+# 1-seat shifter S1 drives the early rider (committed in the first window) and still leads
+# S2 in the next window, as it can in the single model.
+def test_one_window_matches_whole_day():
+    drivers = _frame([], [], [])
+    riders = _frame(['R1'], [0], [0])
+    shifters = _frame(['S1', 'S2'], [15, 20], [1, 0])
+
+    edges = build_candidate_edges(drivers, riders, shifters, 1)
+    whole_day = cpsat_backend.solve_edges(edges, drivers['seats'].tolist(), shifters['seats'].tolist(), len(riders))
+    rolling = rolling_horizon(participants_from_frames(drivers, riders, shifters))
+
+    assert rolling['match_count'] == whole_day['objective'] == 2
+    assert sorted((m['pair'], m['provider'], m['passenger']) for m in rolling['matches']) == [
+        ('shifter_rider', 'S1', 'R1'), ('shifter_shifter', 'S1', 'S2')]
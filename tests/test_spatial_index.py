@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+import spatial_index
+from distances import pairwise_haversine
+from spatial_index import GridIndex
+
+
+# Against brute force, with shared locations (as postcodes give) and a candidate budget small
+# enough to split every batch
+@pytest.mark.parametrize('seed', range(5))
+def test_any_within_matches_brute_force(seed, monkeypatch):
+    rng = np.random.default_rng(seed)
+    monkeypatch.setattr(spatial_index, 'MAX_CANDIDATES', 7)
+    locations = rng.uniform([51.3, -1.1], [51.6, -0.8], (40, 2))
+    points = locations[rng.integers(0, 40, 300)]
+    queries = np.vstack([locations[rng.integers(0, 40, 100)], rng.uniform([51.3, -1.1], [51.6, -0.8], (100, 2))])
+    radius_km = rng.uniform(0.5, 3)
+
+    index = GridIndex(points[:, 0], points[:, 1], radius_km)
+    found = index.any_within(queries[:, 0], queries[:, 1], chunk_size=16)
+    expected = (pairwise_haversine(queries[:, 0], queries[:, 1], points[:, 0], points[:, 1]) <= radius_km).any(axis=1)
+    assert len(index) == 300
+    assert np.array_equal(found, expected)
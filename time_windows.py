@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+# Maximum gap between departure times for two participants to share a ride
+TIME_WINDOW = pd.Timedelta(minutes=30)
+# Optional per-participant column: minutes either side of their departure time they can move.
+# Two participants can share a ride when their departures are at most
+# time_window + both flexibilities apart; without the column everyone has 0.
+FLEXIBILITY_COLUMN = 'flexibility'
+
+
+# Every participant's departure time in int64 nanoseconds since the epoch
+def departure_ns(df):
+    return pd.to_datetime(df['departure_time']).to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+
+# Every participant's flexibility in nanoseconds
+def flexibility_ns(df):
+    if FLEXIBILITY_COLUMN not in df:
+        return np.zeros(len(df), dtype=np.int64)
+    minutes = np.nan_to_num(np.asarray(df[FLEXIBILITY_COLUMN], dtype=np.float64))
+    if (minutes < 0).any():
+        raise ValueError('%s must not be negative' % FLEXIBILITY_COLUMN)
+    return np.round(minutes * 60e9).astype(np.int64)
+
+
+# Provider x passenger mask of departure pairs within the window, widened by each side's
+# flexibility. Times and flexibilities are int64 nanoseconds (see flexibility_ns).
+def window_mask(provider_times, passenger_times, time_window=TIME_WINDOW, provider_flex=None, passenger_flex=None):
+    gap = np.abs(provider_times[:, None] - passenger_times[None, :])
+    reach = pd.Timedelta(time_window).value
+    if provider_flex is not None and (provider_flex.any() or passenger_flex.any()):
+        reach = reach + provider_flex[:, None] + passenger_flex[None, :]
+    return gap <= reach
+
+
+# For each query time, True when at least one target departs within +/- window. window may be
+# an array with one window per query. sorted_targets must be ascending; each query costs two
+# binary searches.
+def any_within_window(query_times, sorted_targets, window=TIME_WINDOW):
+    window = pd.Timedelta(window).value if np.ndim(window) == 0 else window
+    lo = np.searchsorted(sorted_targets, query_times - window, side='left')
+    hi = np.searchsorted(sorted_targets, query_times + window, side='right')
+    return hi > lo
+
+
+# Departure-window masks for every role in one pass: each role's times are sorted once and
+# every other role is tested against them. A rider needs a driver or shifter, a driver needs
+# a rider or shifter, and a shifter can pair with anyone (including another shifter).
+# With flexibility, a query's window is widened by its own and the most flexible target's, so
+# the masks keep everyone who has a counterpart (and possibly a few more).
+def departure_window_masks(drivers_df, riders_df, shifters_df, window=TIME_WINDOW):
+    sheets = {'driver': drivers_df, 'rider': riders_df, 'shifter': shifters_df}
+    times = {role: departure_ns(df) for role, df in sheets.items()}
+    flex = {role: flexibility_ns(df) for role, df in sheets.items()}
+    max_flex = {role: int(values.max()) if len(values) else 0 for role, values in flex.items()}
+    sorted_times = {role: np.sort(values) for role, values in times.items()}
+    counterparts = {
+        'driver': ('rider', 'shifter'),
+        'rider': ('driver', 'shifter'),
+        'shifter': ('driver', 'rider', 'shifter'),
+    }
+
+    masks = {}
+    for role, others in counterparts.items():
+        mask = np.zeros(len(times[role]), dtype=bool)
+        for other in others:
+            mask |= any_within_window(times[role], sorted_times[other],
+                                      pd.Timedelta(window).value + flex[role] + max_flex[other])
+        masks[role] = mask
+    return masks
@@ -0,0 +1,94 @@
+import argparse
+import csv
+import json
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from backends import get_backend
+from candidate_edges import candidate_distances
+from dataset_io import load_dataset
+from instrumentation import Instrumentation
+from postcode_distances import METRICS, PostcodeDistanceTable
+from time_windows import TIME_WINDOW
+
+FIELDS = ['tolerance', 'edges', 'status', 'matches', 'bound', 'gap', 'nodes', 'build_time', 'solve_time',
+          'extract_time']
+
+
+# Match counts for several distance tolerances in one run. Distances are computed once; the
+# model is built once for the largest tolerance and tightened for each smaller one by fixing
+# the edges beyond it to zero (see solve_tolerances in the backends), and every solve starts
+# from the solution of the tolerance before it. Returns one row per tolerance, smallest first.
+# distance is a distance provider (see distances.py); tolerances are in its unit.
+def tolerance_sweep(drivers_df, riders_df, shifters_df, tolerances, backend='cpsat', time_window=TIME_WINDOW,
+                    config=None, log_output=False, instrument=None, distance=None):
+    instrument = instrument or Instrumentation()
+    candidates = candidate_distances(drivers_df, riders_df, shifters_df, time_window, instrument, distance)
+    largest = max(tolerances)
+    edges = {}
+    edge_distances = {}
+    for pair, (rows, cols, pair_distances) in candidates.items():
+        keep = pair_distances <= largest
+        edges[pair] = list(zip(rows[keep].tolist(), cols[keep].tolist()))
+        edge_distances[pair] = pair_distances[keep]
+
+    rows = []
+    solves = get_backend(backend).solve_tolerances(edges, edge_distances, drivers_df['seats'].tolist(),
+                                                   shifters_df['seats'].tolist(), len(riders_df), tolerances,
+                                                   log_output=log_output, config=config, instrument=instrument)
+    for tolerance, result in solves:
+        row = {key: result.get(key) for key in FIELDS}
+        row.update(tolerance=tolerance, matches=result['objective'],
+                   edges=int(sum(np.count_nonzero(distance <= tolerance) for distance in edge_distances.values())))
+        instrument.emit('tolerance', **row)
+        rows.append(row)
+    return rows
+
+
+def write_results(rows, output):
+    if output.endswith('.json'):
+        with open(output, 'w') as f:
+            json.dump(rows, f, indent=2)
+    else:
+        with open(output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def main():
+    warnings.filterwarnings('ignore')  # Only for the command line; importers keep their own filters
+    parser = argparse.ArgumentParser(description='Solve one dataset at several distance tolerances, reusing the '
+                                                 'distances and the model between them.')
+    parser.add_argument('dataset', help='Workbook, CSV folder or dataset bundle')
+    parser.add_argument('--tolerances', nargs='+', type=float, default=[1, 2, 5, 10, 20])
+    parser.add_argument('--backend', default='cpsat', choices=['cpsat', 'gurobi', 'heuristic'])
+    parser.add_argument('--time-window', type=float, default=TIME_WINDOW.total_seconds() / 60,
+                        help='Departure time window in minutes')
+    parser.add_argument('--distance-table', default=None,
+                        help='Postcode distance table (see postcode_distances.py) instead of straight-line distances')
+    parser.add_argument('--metric', default='distance_km', choices=METRICS,
+                        help='With --distance-table, the matrix the tolerances apply to')
+    parser.add_argument('--output', default=None, help='Also write the table to this .csv or .json file')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    drivers_df, riders_df, shifters_df = load_dataset(args.dataset)
+    distance = PostcodeDistanceTable(args.distance_table, args.metric) if args.distance_table else None
+    rows = tolerance_sweep(drivers_df, riders_df, shifters_df, args.tolerances, args.backend,
+                           pd.Timedelta(minutes=args.time_window), distance=distance)
+    print('tolerance', 'edges', 'status', 'matches', 'build_time', 'solve_time', sep='\t')
+    for row in rows:
+        print(row['tolerance'], row['edges'], row['status'], row['matches'], round(row['build_time'], 3),
+              round(row['solve_time'], 3), sep='\t')
+    print('Total time:', round(time.time() - start_time, 2), 'seconds')
+    if args.output:
+        write_results(rows, args.output)
+        print('Results written to', args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+from collections import deque
+
+
+# Capacitated bipartite b-matching by augmenting paths (Kuhn's algorithm with seat counts).
+# options[p] lists the providers passenger p may ride with and capacity[k] is provider k's
+# seat count. provider_of[p] is the provider seating passenger p, or -1. With journal=True
+# every change is recorded so a caller can try a sequence of moves and roll them back.
+class BMatching:
+    def __init__(self, options, capacity, journal=False):
+        self.options = options
+        self.capacity = capacity
+        self.provider_of = [-1] * len(options)
+        self.passengers_of = [set() for _ in capacity]
+        self.journal = [] if journal else None
+
+    def seat(self, passenger, provider):
+        previous = self.provider_of[passenger]
+        if self.journal is not None:
+            self.journal.append((passenger, previous))
+        if previous != -1:
+            self.passengers_of[previous].discard(passenger)
+        if provider != -1:
+            self.passengers_of[provider].add(passenger)
+        self.provider_of[passenger] = provider
+
+    def unseat(self, passenger):
+        self.seat(passenger, -1)
+
+    def load(self, provider):
+        return len(self.passengers_of[provider])
+
+    # Seat an unmatched passenger, moving already seated passengers along an alternating path
+    # (passenger -> provider -> passenger seated there -> ...) to a provider with a free seat
+    def augment(self, start, allowed=None):
+        reached_from = {}  # provider -> passenger that reached it
+        seated_at = {start}
+        queue = deque([start])
+        while queue:
+            passenger = queue.popleft()
+            for provider in self.options[passenger]:
+                if provider in reached_from or (allowed is not None and not allowed(provider)):
+                    continue
+                reached_from[provider] = passenger
+                if self.load(provider) < self.capacity[provider]:
+                    # Flip the path: each passenger on it moves to the provider that follows it
+                    while True:
+                        passenger = reached_from[provider]
+                        previous = self.provider_of[passenger]
+                        self.seat(passenger, provider)
+                        if passenger == start:
+                            return True
+                        provider = previous
+                for other in self.passengers_of[provider]:
+                    if other not in seated_at:
+                        seated_at.add(other)
+                        queue.append(other)
+        return False
+
+    def checkpoint(self):
+        return len(self.journal)
+
+    def rollback(self, checkpoint):
+        while len(self.journal) > checkpoint:
+            passenger, previous = self.journal.pop()
+            current = self.provider_of[passenger]
+            if current != -1:
+                self.passengers_of[current].discard(passenger)
+            if previous != -1:
+                self.passengers_of[previous].add(passenger)
+            self.provider_of[passenger] = previous
+
+
+# Place passengers with the fewest options first and return the provider of each (-1 if unmatched)
+def b_matching(options, capacity):
+    matching = BMatching(options, capacity)
+    for passenger in sorted(range(len(options)), key=lambda p: len(options[p])):
+        if options[passenger]:
+            matching.augment(passenger)
+    return matching.provider_of
+
+
+# Greedy maximal matching where every participant is in at most one pair, most constrained first
+def _single_pairing(pairs, n):
+    degree = [0] * n
+    for i, j in pairs:
+        degree[i] += 1
+        degree[j] += 1
+    used = [False] * n
+    chosen = []
+    for i, j in sorted(pairs, key=lambda e: degree[e[0]] + degree[e[1]]):
+        if not used[i] and not used[j]:
+            used[i] = used[j] = True
+            chosen.append((i, j))
+    return chosen
+
+
+# Fast feasible assignment over the candidate edges, in the same format the backends return:
+# 1. riders are b-matched to drivers and shifters (shifters with riders become drivers, z = 1)
+# 2. idle shifters are b-matched as riders into the drivers' remaining seats
+# 3. shifter/shifter pairs (w) are chosen by a greedy maximal matching
+def greedy_assignment(edges, driver_seats, shifter_seats, n_riders):
+    n_drivers = len(driver_seats)
+    n_shifters = len(shifter_seats)
+
+    options = [[] for _ in range(n_riders)]
+    for i, j in edges['driver_rider']:
+        options[j].append(i)
+    for i, j in edges['shifter_rider']:
+        options[j].append(n_drivers + i)
+    capacity = [int(seats) for seats in driver_seats] + [int(seats) for seats in shifter_seats]
+    provider_of = b_matching(options, capacity)
+
+    assignment = {'driver_rider': [], 'shifter_rider': [], 'driver_shifter': [], 'shifter_shifter': []}
+    driver_load = [0] * n_drivers
+    driving = [False] * n_shifters
+    for rider, provider in enumerate(provider_of):
+        if provider == -1:
+            continue
+        if provider < n_drivers:
+            assignment['driver_rider'].append((provider, rider))
+            driver_load[provider] += 1
+        else:
+            assignment['shifter_rider'].append((provider - n_drivers, rider))
+            driving[provider - n_drivers] = True
+
+    shifter_options = [[] for _ in range(n_shifters)]
+    for i, j in edges['driver_shifter']:
+        if not driving[j]:
+            shifter_options[j].append(i)
+    residual = [int(seats) - load for seats, load in zip(driver_seats, driver_load)]
+    for shifter, driver in enumerate(b_matching(shifter_options, residual)):
+        if driver != -1:
+            assignment['driver_shifter'].append((driver, shifter))
+
+    assignment['shifter_shifter'] = _single_pairing(edges['shifter_shifter'], n_shifters)
+
+    for pairs in assignment.values():
+        pairs.sort()
+    return assignment
+
+
+def assignment_size(assignment):
+    return sum(len(pairs) for pairs in assignment.values())
+
+
+# Shifters that take at least one rider, i.e. the ones with z = 1 in an assignment
+def active_shifters(assignment):
+    return sorted({i for i, _ in assignment['shifter_rider']})